@@ -1,3 +1,8 @@
+import time
+
+# Measured for the startup report
+_import_started = time.perf_counter()
+
 from fastapi import FastAPI, HTTPException, Form, File, UploadFile
 from pydantic import BaseModel, Field
 import os
@@ -5,24 +10,42 @@ from dotenv import load_dotenv
 from services.sabi_service import handle_sabi_query
 from services.trace_service import handle_trace_query
 from services.katsu_service import handle_katsu_query
+from services.index_store import APP_FOLDERS, load_all_indexes, update_document
+from services.executor import run_blocking, shutdown_executor
 from functions.sabi_functions import router as sabi_router
+from functions.record_store import close_record_store
+from services.training_log import close_training_log
 from typing import List
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi import Request
 from fastapi.middleware.cors import CORSMiddleware
 import shutil
 import csv
+import json
+import asyncio
 from datetime import datetime
 from typing import Optional
 from app.models import FeedbackData
-from scripts.improve_responses import update_training_data, improve_response
+from scripts.improve_responses import update_training_data, improve_response, IMPROVEMENT_MODE
+from services.model_clients import client_report, close_clients
+from services.feedback_index import get_feedback_index
+from app.session_manager import SessionManager
+from services.metrics import (
+    REQUEST_SECONDS, METRICS_TIMING_HEADER, timed, render as render_metrics,
+    start_request_timing, server_timing_header
+)
+
+_import_seconds = time.perf_counter() - _import_started
 
 
 # Load environment variables
 load_dotenv()
 
+# Conversation state per app and customer, for multi-turn flows
+session_manager = SessionManager()
+
 # Initialize FastAPI app with metadata
 app = FastAPI(
     title="Sabi's Chatbot API",
@@ -93,8 +116,49 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Server-Timing"],
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Times every request and, if enabled, reports its stage durations in a Server-Timing header."""
+    timings = start_request_timing()
+    started = time.perf_counter()
+    response = await call_next(request)
+    seconds = time.perf_counter() - started
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(seconds, getattr(route, "path", "unmatched"), str(response.status_code))
+    if METRICS_TIMING_HEADER:
+        # Streamed responses only include the stages finished before the first byte
+        response.headers["Server-Timing"] = server_timing_header(timings + [("total", seconds)])
+    return response
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics for this worker."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.on_event("startup")
+async def load_indexes():
+    """Load the saved per-app document indexes (building any that are missing or stale)."""
+    started = time.perf_counter()
+    await run_blocking(load_all_indexes)
+    report_startup(time.perf_counter() - started)
+
+def report_startup(index_seconds: float):
+    """Print how long the worker took to import, load indexes and create model clients."""
+    print(f"Startup: imports {_import_seconds:.2f}s, indexes {index_seconds:.2f}s")
+    for name, seconds in client_report().items():
+        print(f"Startup: created {name} client in {seconds:.2f}s")
+
+@app.on_event("shutdown")
+async def finish_blocking_work():
+    """Let queued file writes complete before the worker exits."""
+    close_record_store()
+    close_training_log()
+    shutdown_executor()
+    await close_clients()
+
 # Enhanced request model with better documentation
 class QueryRequest(BaseModel):
     query: str = Field(
@@ -164,30 +228,7 @@ async def get_chatbot_response(query_request: QueryRequest):
     If an error occurs, returns a 500 error with details.
     """
     try:
-        # Get initial response
-        if query_request.app.lower() == "sabi":
-            initial_answer = await handle_sabi_query(query_request.query, query_request.name, query_request.address)
-        elif query_request.app.lower() == "trace":
-            initial_answer = await handle_trace_query(query_request.query, query_request.name)
-        elif query_request.app.lower() == "katsu":
-            initial_answer = await handle_katsu_query(query_request.query, query_request.name)
-        else:
-            return QueryResponse(answer="Invalid app specified.")
-
-        # Improve response if not a system message
-        if not any(msg in initial_answer for msg in [
-            "Thank you for submitting",
-            "Please provide",
-            "To process your"
-        ]):
-            improved_answer = await improve_response(
-                query_request.app,
-                query_request.query,
-                initial_answer
-            )
-            return QueryResponse(answer=improved_answer)
-
-        return QueryResponse(answer=initial_answer)
+        return QueryResponse(answer=await respond(query_request))
     
     except Exception as e:
         raise HTTPException(
@@ -195,6 +236,88 @@ async def get_chatbot_response(query_request: QueryRequest):
             detail=f"An error occurred while processing your request: {str(e)}"
         )
 
+@app.post("/chatbot/stream",
+    tags=["Chatbot"],
+    summary="Process a chatbot query, streaming the answer",
+    description="""
+    Same as `/chatbot`, but the answer is streamed as newline-delimited JSON while
+    it is generated: `{"token": ...}` lines with the next piece of text, then one
+    `{"answer": ..., "done": true}` line with the complete answer (which replaces
+    the streamed text), or `{"error": ..., "done": true}` if the request failed.
+    """
+)
+async def stream_chatbot_response(query_request: QueryRequest):
+    async def events():
+        tokens = asyncio.Queue()
+        task = asyncio.create_task(respond(query_request, tokens.put_nowait))
+        task.add_done_callback(lambda _: tokens.put_nowait(None))
+        try:
+            while True:
+                token = await tokens.get()
+                if token is None:
+                    break
+                yield json.dumps({"token": token}) + "\n"
+            yield json.dumps({"answer": task.result(), "done": True}) + "\n"
+        except Exception as e:
+            yield json.dumps({
+                "error": f"An error occurred while processing your request: {str(e)}",
+                "done": True
+            }) + "\n"
+        finally:
+            # The client went away before the answer was complete
+            if not task.done():
+                task.cancel()
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+async def respond(query_request: QueryRequest, on_token=None) -> str:
+    """Answers a chatbot query and records the turn in the customer's session.
+
+    If `on_token` is given, it receives the text of the final answer as it is
+    generated: the QA answer when it is returned as is, otherwise the improved one.
+    """
+    # Metrics are labelled by app, so unknown names are rejected before any are recorded
+    app_name = query_request.app.lower()
+    if app_name not in APP_FOLDERS:
+        return "Invalid app specified."
+
+    session_key = f"{app_name}:{query_request.name}"
+    with timed(app_name, "session"):
+        session = await run_blocking(session_manager.get_session, session_key)
+
+    # Only the last generation step produces the text the customer sees
+    qa_on_token = on_token if IMPROVEMENT_MODE in ("off", "fused") else None
+
+    # Get initial response
+    templated = False
+    if app_name == "sabi":
+        reply = await handle_sabi_query(
+            query_request.query, query_request.name, query_request.address, session.state, qa_on_token
+        )
+        initial_answer, templated = reply.text, reply.templated
+    elif app_name == "trace":
+        initial_answer = await handle_trace_query(query_request.query, query_request.name, qa_on_token)
+    else:
+        initial_answer = await handle_katsu_query(query_request.query, query_request.name, qa_on_token)
+
+    # Template replies (confirmations, prompts, fallbacks) are final; only generated answers are improved
+    if not templated:
+        answer = await improve_response(
+            app_name,
+            query_request.query,
+            initial_answer,
+            on_token
+        )
+    else:
+        answer = initial_answer
+
+    with timed(app_name, "session"):
+        await run_blocking(
+            session_manager.add_turn, session_key, session,
+            query_request.query, answer, session.state.get("last_intent")
+        )
+    return answer
+
 @app.get("/", 
     tags=["Status"],
     summary="Check API Status",
@@ -243,13 +366,7 @@ async def upload_document(
 ):
     """Upload a document for training the chatbot"""
     try:
-        app_folders = {
-            "sabi": "documents/sabiMarket",
-            "trace": "documents/trace",
-            "katsu": "documents/katsu"
-        }
-        
-        folder = app_folders.get(app.lower())
+        folder = APP_FOLDERS.get(app.lower())
         if not folder:
             raise HTTPException(status_code=400, detail="Invalid application specified")
             
@@ -259,8 +376,10 @@ async def upload_document(
         os.makedirs(folder, exist_ok=True)
         file_path = os.path.join(folder, document.filename)
         
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(document.file, buffer)
+        await run_blocking(save_upload, file_path, document.file)
+
+        # Embed only the new or changed document into the live index
+        await run_blocking(update_document, app.lower(), document.filename)
             
         return {
             "message": f"Document successfully uploaded to {folder}",
@@ -270,38 +389,46 @@ async def upload_document(
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    
+
+def save_upload(file_path: str, source):
+    """Copy an uploaded file to disk"""
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(source, buffer)
 
 
 @app.get("/upload", response_class=HTMLResponse)
 async def upload_ui(request: Request):
     return templates.TemplateResponse("document_upload.html", {"request": request})
 
+def write_feedback(feedback: FeedbackData):
+    """Append a feedback entry to the app feedback CSV"""
+    feedback_file = f'feedback/{feedback.app}_feedback.csv'
+    os.makedirs('feedback', exist_ok=True)
+    
+    is_new_file = not os.path.exists(feedback_file)
+    mode = 'a'  # Always append
+    
+    with open(feedback_file, mode, newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        if is_new_file:
+            writer.writerow(['timestamp', 'query', 'response', 'rating', 'comment'])
+        writer.writerow([
+            feedback.timestamp,
+            feedback.query.replace(',', ' '),
+            feedback.response.replace(',', ' '),
+            '👍' if feedback.rating else '👎',
+            feedback.comment or ""
+        ])
+    
+    # Update training data and the few-shot examples only for positive feedback
+    if feedback.rating:
+        update_training_data(feedback.app, feedback.query, feedback.response)
+        get_feedback_index(feedback.app).refresh()
+
 @app.post("/feedback")
 async def save_feedback(feedback: FeedbackData):
     try:
-        feedback_file = f'feedback/{feedback.app}_feedback.csv'
-        os.makedirs('feedback', exist_ok=True)
-        
-        is_new_file = not os.path.exists(feedback_file)
-        mode = 'a'  # Always append
-        
-        with open(feedback_file, mode, newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            if is_new_file:
-                writer.writerow(['timestamp', 'query', 'response', 'rating', 'comment'])
-            writer.writerow([
-                feedback.timestamp,
-                feedback.query.replace(',', ' '),
-                feedback.response.replace(',', ' '),
-                '👍' if feedback.rating else '👎',
-                feedback.comment or ""
-            ])
-        
-        # Update training data only for positive feedback
-        if feedback.rating:
-            update_training_data(feedback.app, feedback.query, feedback.response)
-        
+        await run_blocking(write_feedback, feedback)
         return {"status": "success"}
     except Exception as e:
         print(f"Feedback error: {str(e)}")
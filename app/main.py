@@ -1,9 +1,33 @@
 # app/main.py
 
+import os
+import argparse
 import uvicorn
 from fastapi import FastAPI
 from app.chatbot_api import app
+from services.index_store import publish_all_indexes
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the chatbot API")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")),
+        help="Worker processes; they share the published indexes through memory-mapped files"
+    )
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        # In-memory sessions are per worker, so multi-turn flows would depend on which worker answers
+        session_store = os.getenv("SESSION_STORE")
+        if session_store is None:
+            os.environ["SESSION_STORE"] = "sqlite"
+            print("Using SESSION_STORE=sqlite so sessions are shared by the workers")
+        elif session_store.lower() != "sqlite":
+            parser.error(f"SESSION_STORE={session_store} keeps sessions per worker; use sqlite with --workers > 1")
+
+        # Build or update every index once, so workers only map the published files
+        publish_all_indexes()
+        uvicorn.run("app.chatbot_api:app", host=args.host, port=args.port, workers=args.workers)
+    else:
+        uvicorn.run(app, host=args.host, port=args.port)
@@ -1,20 +1,194 @@
 # app/session_manager.py
 
-from typing import Dict
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+from typing import NamedTuple, Optional
+
+# Where conversation state lives: "memory" (per worker, default) or "sqlite" (shared by workers)
+SESSION_STORE = os.getenv("SESSION_STORE", "memory").lower()
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "cache/sessions.sqlite3")
+
+# Sessions idle for longer than this many seconds are dropped
+SESSION_TTL = float(os.getenv("SESSION_TTL", "1800"))
+# Most sessions kept at once; the least recently used go first
+SESSION_MAX_USERS = int(os.getenv("SESSION_MAX_USERS", "10000"))
+# Turns kept per session and characters kept per query/answer
+SESSION_HISTORY_SIZE = int(os.getenv("SESSION_HISTORY_SIZE", "10"))
+SESSION_TURN_CHARS = int(os.getenv("SESSION_TURN_CHARS", "500"))
+
+
+class Turn(NamedTuple):
+    """One exchange, truncated to SESSION_TURN_CHARS."""
+    timestamp: float
+    query: str
+    answer: str
+    intent: Optional[str] = None
+
+
+class Session:
+    """Recent turns (a ring buffer) and the state multi-turn flows carry between them."""
+
+    __slots__ = ("history", "state", "updated")
+
+    def __init__(self, history=(), state: dict = None, updated: float = None):
+        self.history = deque(history, maxlen=SESSION_HISTORY_SIZE)
+        self.state = state or {}
+        self.updated = updated or time.time()
+
+    def to_json(self) -> str:
+        return json.dumps({"history": [list(turn) for turn in self.history], "state": self.state})
+
+    @classmethod
+    def from_json(cls, data: str, updated: float):
+        data = json.loads(data)
+        return cls((Turn(*turn) for turn in data.get("history", [])), data.get("state"), updated)
+
+
+class MemorySessionBackend:
+    """Sessions kept in this worker's memory, evicted by TTL and LRU."""
+
+    def __init__(self, ttl: float = SESSION_TTL, max_sessions: int = SESSION_MAX_USERS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Session]:
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                return None
+            if time.time() - session.updated > self.ttl:
+                del self._sessions[key]
+                return None
+            self._sessions.move_to_end(key)
+            return session
+
+    def put(self, key: str, session: Session):
+        with self._lock:
+            session.updated = time.time()
+            self._sessions[key] = session
+            self._sessions.move_to_end(key)
+            # Oldest entries are at the front, so expired ones are dropped from there
+            cutoff = session.updated - self.ttl
+            while self._sessions:
+                oldest = next(iter(self._sessions.values()))
+                if oldest.updated >= cutoff and len(self._sessions) <= self.max_sessions:
+                    break
+                self._sessions.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._sessions.pop(key, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class SQLiteSessionBackend:
+    """Sessions kept in a SQLite file in WAL mode, shared by every uvicorn worker."""
+
+    # Expired and excess sessions are purged every this many writes
+    PURGE_EVERY = 100
+
+    def __init__(self, db_path: str = SESSION_DB_PATH, ttl: float = SESSION_TTL,
+                 max_sessions: int = SESSION_MAX_USERS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._writes = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (key TEXT PRIMARY KEY, data TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions (updated)")
+        self._db.commit()
+
+    def get(self, key: str) -> Optional[Session]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data, updated FROM sessions WHERE key = ? AND updated >= ?",
+                (key, time.time() - self.ttl)
+            ).fetchone()
+        return Session.from_json(*row) if row else None
+
+    def put(self, key: str, session: Session):
+        session.updated = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (key, data, updated) VALUES (?, ?, ?)",
+                (key, session.to_json(), session.updated)
+            )
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                self._purge(session.updated)
+            self._db.commit()
+
+    def _purge(self, now: float):
+        self._db.execute("DELETE FROM sessions WHERE updated < ?", (now - self.ttl,))
+        self._db.execute(
+            "DELETE FROM sessions WHERE key IN "
+            "(SELECT key FROM sessions ORDER BY updated DESC LIMIT -1 OFFSET ?)",
+            (self.max_sessions,)
+        )
+
+    def delete(self, key: str):
+        with self._lock:
+            self._db.execute("DELETE FROM sessions WHERE key = ?", (key,))
+            self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
 
 class SessionManager:
-    def __init__(self):
-        self.sessions: Dict[str, dict] = {}
+    def __init__(self, backend=None):
+        if backend is None:
+            backend = SQLiteSessionBackend() if SESSION_STORE == "sqlite" else MemorySessionBackend()
+        self.backend = backend
 
-    def create_session(self, user_name: str):
+    def create_session(self, user_name: str) -> Session:
         """Creates a new session for a user."""
-        self.sessions[user_name] = {"history": []}
+        session = Session()
+        self.backend.put(user_name, session)
+        return session
+
+    def get_session(self, user_name: str) -> Session:
+        """Returns the user's live session, or a new empty one."""
+        return self.backend.get(user_name) or Session()
+
+    def save_session(self, user_name: str, session: Session):
+        """Stores the session and restarts its idle timer."""
+        self.backend.put(user_name, session)
+
+    def add_turn(self, user_name: str, session: Session, query: str, answer: str, intent: str = None):
+        """Appends an exchange to the session history and stores the session."""
+        session.history.append(Turn(
+            time.time(),
+            query[:SESSION_TURN_CHARS],
+            answer[:SESSION_TURN_CHARS],
+            intent
+        ))
+        self.save_session(user_name, session)
 
     def add_to_history(self, user_name: str, message: str):
         """Adds a message to the user's session history."""
-        if user_name in self.sessions:
-            self.sessions[user_name]["history"].append(message)
+        session = self.backend.get(user_name)
+        if session is not None:
+            self.add_turn(user_name, session, message, "")
 
     def get_history(self, user_name: str):
         """Retrieves the session history for a user."""
-        return self.sessions.get(user_name, {}).get("history", [])
+        session = self.backend.get(user_name)
+        return list(session.history) if session else []
@@ -0,0 +1,236 @@
+# functions/record_store.py
+
+import os
+import csv
+import atexit
+import sqlite3
+import threading
+from functions.record_writer import CSVRecordSink, SQLiteRecordSink
+
+# Storage backend for customer records: "csv" (default) or "sqlite"
+RECORD_STORE = os.getenv("RECORD_STORE", "csv").lower()
+RECORD_DB_PATH = os.getenv("RECORD_DB_PATH", "customerrecords/records.sqlite3")
+
+# Record types with their CSV file, SQLite table and columns
+RECORD_TYPES = {
+    "orders": {
+        "file": 'customerrecords/neworder.csv',
+        "table": "new_orders",
+        "columns": ['timestamp', 'name', 'order_details', 'address']
+    },
+    "returns": {
+        "file": 'customerrecords/orderreturns.csv',
+        "table": "order_returns",
+        "columns": ['timestamp', 'name', 'order_number', 'reason']
+    },
+    "issues": {
+        "file": 'customerrecords/issues.csv',
+        "table": "issues",
+        "columns": ['timestamp', 'name', 'issue_description']
+    },
+    "callbacks": {
+        "file": 'customerrecords/customerrecords.csv',
+        "table": "callbacks",
+        "columns": ['timestamp', 'name', 'phone_number', 'reason']
+    },
+    "tracking": {
+        "file": 'customerrecords/trackorder.csv',
+        "table": "track_orders",
+        "columns": ['timestamp', 'name', 'order_number']
+    }
+}
+
+# Columns that get an index wherever a record type has them
+INDEXED_COLUMNS = ('timestamp', 'name', 'order_number')
+
+
+def _check_filters(kind: str, filters: dict):
+    columns = RECORD_TYPES[kind]["columns"]
+    for column in filters:
+        if column not in columns:
+            raise ValueError(f"Unknown column '{column}' for {kind} records")
+
+
+def _in_range(timestamp: str, start: str = None, end: str = None) -> bool:
+    return (start is None or timestamp >= start) and (end is None or timestamp <= end)
+
+
+class CSVRecordStore:
+    """Customer records kept in the CSV files under customerrecords/."""
+
+    def __init__(self):
+        self.sink = CSVRecordSink()
+
+    def append(self, kind: str, row: list):
+        """Queues a record; values are in the column order of the record type."""
+        record_type = RECORD_TYPES[kind]
+        self.sink.append(record_type["file"], record_type["columns"], row)
+
+    def query(self, kind: str, filters: dict = None, start: str = None, end: str = None,
+              after: int = None, offset: int = 0, limit: int = None):
+        """Yields (record id, record dict) pairs as the file is read.
+
+        Records must match every filter value and fall within the start/end
+        timestamps. The record id is the row number, so passing the last id
+        seen as `after` continues from the next row.
+        """
+        filters = filters or {}
+        _check_filters(kind, filters)
+        self.sink.flush()
+
+        file_path = RECORD_TYPES[kind]["file"]
+        if not os.path.exists(file_path) or limit == 0:
+            return
+        returned = 0
+        with open(file_path, 'r', newline='', encoding='utf-8') as file:
+            for record_id, row in enumerate(csv.DictReader(file), start=1):
+                if after is not None and record_id <= after:
+                    continue
+                if not all(row.get(column) == value for column, value in filters.items()):
+                    continue
+                if not _in_range(row.get('timestamp', ''), start, end):
+                    continue
+                if offset:
+                    offset -= 1
+                    continue
+                yield record_id, row
+                returned += 1
+                if limit is not None and returned >= limit:
+                    return
+
+    def close(self):
+        self.sink.close()
+
+
+class SQLiteRecordStore:
+    """Customer records kept in a SQLite database in WAL mode.
+
+    Writes are group-committed by a SQLiteRecordSink; reads open their own
+    connection so they run alongside the writer and other workers.
+    """
+
+    def __init__(self, db_path: str = RECORD_DB_PATH):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._create_schema()
+        self.sink = SQLiteRecordSink(db_path)
+
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, check_same_thread=False)
+        db.execute("PRAGMA busy_timeout=5000")
+        return db
+
+    def _create_schema(self):
+        db = self._connect()
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            with db:
+                for record_type in RECORD_TYPES.values():
+                    table = record_type["table"]
+                    columns = ", ".join(f"{column} TEXT" for column in record_type["columns"])
+                    db.execute(f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, {columns})")
+                    for column in INDEXED_COLUMNS:
+                        if column in record_type["columns"]:
+                            db.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table} ({column})")
+        finally:
+            db.close()
+
+    def append(self, kind: str, row: list):
+        """Queues a record; values are in the column order of the record type."""
+        record_type = RECORD_TYPES[kind]
+        self.sink.append(record_type["table"], record_type["columns"], row)
+
+    def insert_many(self, kind: str, rows: list) -> int:
+        """Inserts records directly in one transaction (used by the CSV import)."""
+        record_type = RECORD_TYPES[kind]
+        columns = record_type["columns"]
+        db = self._connect()
+        try:
+            with db:
+                db.executemany(
+                    f"INSERT INTO {record_type['table']} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                    rows
+                )
+        finally:
+            db.close()
+        return len(rows)
+
+    def count(self, kind: str) -> int:
+        db = self._connect()
+        try:
+            return db.execute(f"SELECT COUNT(*) FROM {RECORD_TYPES[kind]['table']}").fetchone()[0]
+        finally:
+            db.close()
+
+    def query(self, kind: str, filters: dict = None, start: str = None, end: str = None,
+              after: int = None, offset: int = 0, limit: int = None):
+        """Yields (record id, record dict) pairs as rows are fetched.
+
+        Records must match every filter value and fall within the start/end
+        timestamps. Passing the last id seen as `after` continues from the
+        next record without rescanning earlier ones.
+        """
+        filters = filters or {}
+        _check_filters(kind, filters)
+        self.sink.flush()
+
+        record_type = RECORD_TYPES[kind]
+        columns = record_type["columns"]
+        conditions = [f"{column} = ?" for column in filters]
+        params = list(filters.values())
+        if start is not None:
+            conditions.append("timestamp >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append("timestamp <= ?")
+            params.append(end)
+        if after is not None:
+            conditions.append("id > ?")
+            params.append(after)
+
+        sql = f"SELECT id, {', '.join(columns)} FROM {record_type['table']}"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY id LIMIT ? OFFSET ?"
+        params.extend([-1 if limit is None else limit, offset])
+
+        db = self._connect()
+        try:
+            for values in db.execute(sql, params):
+                yield values[0], dict(zip(columns, values[1:]))
+        finally:
+            db.close()
+
+    def close(self):
+        self.sink.close()
+
+
+_record_store = None
+_record_store_lock = threading.Lock()
+
+
+def get_record_store():
+    """Returns the configured customer record store."""
+    global _record_store
+    if _record_store is None:
+        with _record_store_lock:
+            if _record_store is None:
+                if RECORD_STORE == "sqlite":
+                    _record_store = SQLiteRecordStore()
+                else:
+                    _record_store = CSVRecordStore()
+    return _record_store
+
+
+def close_record_store():
+    """Writes pending records and closes the store."""
+    global _record_store
+    with _record_store_lock:
+        if _record_store is not None:
+            _record_store.close()
+            _record_store = None
+
+
+atexit.register(close_record_store)
@@ -0,0 +1,232 @@
+# functions/record_writer.py
+
+import os
+import io
+import csv
+import sqlite3
+import queue
+import threading
+import time
+from services.metrics import RECORD_WRITE_SECONDS, RECORD_ROWS, RECORD_ROWS_REJECTED
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process file locks
+    fcntl = None
+
+# Rows are written when this many are queued or the interval (seconds) has passed
+RECORD_BATCH_SIZE = int(os.getenv("RECORD_BATCH_SIZE", "100"))
+RECORD_FLUSH_INTERVAL = float(os.getenv("RECORD_FLUSH_INTERVAL", "0.5"))
+# Rows that may wait for the writer; further rows are refused until it catches up
+RECORD_QUEUE_SIZE = int(os.getenv("RECORD_QUEUE_SIZE", "10000"))
+
+
+class RecordQueueFull(RuntimeError):
+    """Raised when a row cannot be queued because the writer has fallen behind."""
+
+
+class RecordSink:
+    """Background writer that group-commits queued rows.
+
+    Rows are appended to a bounded in-process queue and written in batches by a
+    single writer thread; subclasses decide how a batch of rows reaches its
+    target. If the writer stalls and the queue fills up, append() raises
+    RecordQueueFull rather than holding rows in memory without limit, so the
+    caller never acknowledges a row that was not queued.
+    """
+
+    # Store name used in the write metrics
+    store = "records"
+
+    def __init__(self, batch_size: int = RECORD_BATCH_SIZE, flush_interval: float = RECORD_FLUSH_INTERVAL,
+                 queue_size: int = RECORD_QUEUE_SIZE):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._closed = False
+        self._unwritten = 0  # rows queued or waiting to be retried
+        self._unwritten_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="record-sink", daemon=True)
+        self._thread.start()
+
+    def append(self, target: str, header: list, row: list):
+        """Queues a row for a target (file or table) with the given columns; never blocks.
+
+        Raises RecordQueueFull if the queue is full.
+        """
+        if self._closed:
+            raise RuntimeError("Record sink is closed")
+        self._count_unwritten(1)
+        try:
+            self._queue.put_nowait((target, header, row))
+        except queue.Full:
+            self._count_unwritten(-1)
+            RECORD_ROWS_REJECTED.inc(self.store)
+            raise RecordQueueFull(f"Record queue full, cannot queue a row for {target}")
+
+    def _count_unwritten(self, rows: int):
+        with self._unwritten_lock:
+            self._unwritten += rows
+
+    def flush(self, timeout: float = None) -> bool:
+        """Blocks until every row queued so far is written. Returns False on timeout.
+
+        Returns at once when no rows are waiting, so frequent readers keep the
+        benefit of batched writes.
+        """
+        if not self._unwritten:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        """Writes remaining rows, then syncs and closes every target."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        pending = {}
+        count = 0
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = ()
+
+            if isinstance(item, tuple) and item:
+                target, header, row = item
+                pending.setdefault(target, (header, []))[1].append(row)
+                count += 1
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if count < self.batch_size:
+                    continue
+
+            # Batch full, interval elapsed, flush requested or shutting down
+            if pending:
+                pending = self._write(pending)
+                count = sum(len(rows) for _, rows in pending.values())
+            deadline = time.monotonic() + self.flush_interval if pending else None
+
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is None:
+                self._close_targets()
+                return
+
+    def _write(self, pending: dict) -> dict:
+        """Writes each target's rows; returns the rows that failed so they are retried."""
+        failed = {}
+        for target, (header, rows) in pending.items():
+            try:
+                started = time.perf_counter()
+                self._write_rows(target, header, rows)
+                target_name = os.path.basename(target)
+                RECORD_WRITE_SECONDS.observe(time.perf_counter() - started, self.store, target_name)
+                RECORD_ROWS.inc(self.store, target_name, amount=len(rows))
+                self._count_unwritten(-len(rows))
+            except Exception as e:
+                print(f"Error writing records to {target}: {str(e)}")
+                failed[target] = (header, rows)
+        return failed
+
+    def _write_rows(self, target: str, header: list, rows: list):
+        raise NotImplementedError
+
+    def _close_targets(self):
+        pass
+
+
+class CSVRecordSink(RecordSink):
+    """Record sink appending to CSV files.
+
+    Each file is kept open between batches, and every batch is written with one
+    call under an exclusive file lock so rows from concurrent workers never
+    interleave.
+    """
+
+    store = "csv"
+
+    def __init__(self, batch_size: int = RECORD_BATCH_SIZE, flush_interval: float = RECORD_FLUSH_INTERVAL):
+        self._files = {}
+        super().__init__(batch_size, flush_interval)
+
+    def _open(self, file_path: str):
+        file = self._files.get(file_path)
+        if file is None:
+            directory = os.path.dirname(file_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            file = open(file_path, 'a', newline='', encoding='utf-8')
+            self._files[file_path] = file
+        return file
+
+    def _write_rows(self, file_path: str, header: list, rows: list):
+        try:
+            file = self._open(file_path)
+            if fcntl:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            try:
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                # Check the size under the lock so only one worker writes the header
+                if os.fstat(file.fileno()).st_size == 0:
+                    writer.writerow(header)
+                writer.writerows(rows)
+                file.write(buffer.getvalue())
+                file.flush()
+            finally:
+                if fcntl:
+                    fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+        except Exception:
+            # Reopen the file on the next attempt
+            self._files.pop(file_path, None)
+            raise
+
+    def _close_targets(self):
+        for file_path, file in self._files.items():
+            try:
+                file.flush()
+                os.fsync(file.fileno())
+                file.close()
+            except Exception as e:
+                print(f"Error closing {file_path}: {str(e)}")
+        self._files = {}
+
+
+class SQLiteRecordSink(RecordSink):
+    """Record sink inserting into SQLite tables, one transaction per batch.
+
+    The connection is opened by the writer thread, which is the only thread
+    that uses it.
+    """
+
+    store = "sqlite"
+
+    def __init__(self, db_path: str, batch_size: int = RECORD_BATCH_SIZE,
+                 flush_interval: float = RECORD_FLUSH_INTERVAL):
+        self.db_path = db_path
+        self._db = None
+        super().__init__(batch_size, flush_interval)
+
+    def _write_rows(self, table: str, columns: list, rows: list):
+        if self._db is None:
+            self._db = sqlite3.connect(self.db_path)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA busy_timeout=5000")
+        with self._db:
+            self._db.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                rows
+            )
+
+    def _close_targets(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
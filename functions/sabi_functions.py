@@ -1,9 +1,11 @@
-import csv
-import os
+import json
 from datetime import datetime
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
+from functions.record_store import get_record_store
+from services.executor import run_blocking
 
 router = APIRouter()
 
@@ -36,159 +38,124 @@ class TrackOrderData(BaseModel):
     order_number: str
     timestamp: str
 
-def ensure_directory_exists(file_path: str):
-    """Ensures the directory exists for the given file path."""
-    directory = os.path.dirname(file_path)
-    if not os.path.exists(directory):
-        os.makedirs(directory)
+def current_timestamp() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
 def save_new_order(name: str, order_details: str, address: str):
-    """Saves new order details to CSV file."""
-    file_path = 'customerrecords/neworder.csv'
-    ensure_directory_exists(file_path)
-    
-    # Create file with headers if it doesn't exist
-    if not os.path.exists(file_path):
-        with open(file_path, 'w', newline='', encoding='utf-8') as file:
-            writer = csv.writer(file)
-            writer.writerow(['timestamp', 'name', 'order_details', 'address'])
-    
-    # Append new order
-    with open(file_path, 'a', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        writer.writerow([timestamp, name, order_details, address])
+    """Saves new order details to the record store."""
+    get_record_store().append("orders", [current_timestamp(), name, order_details, address])
 
 def save_return_request(name: str, order_number: str, reason: str):
-    """Saves return request details to CSV file."""
-    file_path = 'customerrecords/orderreturns.csv'
-    ensure_directory_exists(file_path)
-    
-    # Create file with headers if it doesn't exist
-    if not os.path.exists(file_path):
-        with open(file_path, 'w', newline='', encoding='utf-8') as file:
-            writer = csv.writer(file)
-            writer.writerow(['timestamp', 'name', 'order_number', 'reason'])
-    
-    # Append new return request
-    with open(file_path, 'a', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        writer.writerow([timestamp, name, order_number, reason])
+    """Saves return request details to the record store."""
+    get_record_store().append("returns", [current_timestamp(), name, order_number, reason])
 
 def save_issue_report(name: str, issue_description: str):
-    """Saves issue report details to CSV file."""
-    file_path = 'customerrecords/issues.csv'
-    ensure_directory_exists(file_path)
-    
-    if not os.path.exists(file_path):
-        with open(file_path, 'w', newline='', encoding='utf-8') as file:
-            writer = csv.writer(file)
-            writer.writerow(['timestamp', 'name', 'issue_description'])
-    
-    with open(file_path, 'a', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        writer.writerow([timestamp, name, issue_description])
+    """Saves issue report details to the record store."""
+    get_record_store().append("issues", [current_timestamp(), name, issue_description])
 
 def save_callback_request(name: str, phone_number: str):
-    """Saves callback request details to CSV file."""
-    file_path = 'customerrecords/customerrecords.csv'
-    ensure_directory_exists(file_path)
-    
-    if not os.path.exists(file_path):
-        with open(file_path, 'w', newline='', encoding='utf-8') as file:
-            writer = csv.writer(file)
-            writer.writerow(['timestamp', 'name', 'phone_number', 'reason'])
-    
-    with open(file_path, 'a', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        writer.writerow([timestamp, name, phone_number, "Requested Callback"])
+    """Saves callback request details to the record store."""
+    get_record_store().append("callbacks", [current_timestamp(), name, phone_number, "Requested Callback"])
 
 def save_track_order(name: str, order_number: str):
-    """Saves order tracking details to CSV file."""
-    file_path = 'customerrecords/trackorder.csv'
-    ensure_directory_exists(file_path)
-    
-    if not os.path.exists(file_path):
-        with open(file_path, 'w', newline='', encoding='utf-8') as file:
-            writer = csv.writer(file)
-            writer.writerow(['timestamp', 'name', 'order_number'])
-    
-    with open(file_path, 'a', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        writer.writerow([timestamp, name, order_number])
+    """Saves order tracking details to the record store."""
+    get_record_store().append("tracking", [current_timestamp(), name, order_number])
+
+# Largest page a single request may ask for
+MAX_PAGE_SIZE = 1000
+
+class RecordQuery:
+    """Pagination, filter and format parameters shared by the record endpoints."""
+
+    def __init__(
+        self,
+        start: Optional[str] = Query(None, description="Earliest timestamp or date (YYYY-MM-DD[ HH:MM:SS])"),
+        end: Optional[str] = Query(None, description="Latest timestamp or date (YYYY-MM-DD[ HH:MM:SS]), inclusive"),
+        name: Optional[str] = Query(None, description="Customer name"),
+        cursor: Optional[int] = Query(None, ge=0, description="Return records after this cursor (from X-Next-Cursor)"),
+        offset: int = Query(0, ge=0, description="Records to skip"),
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Maximum records to return"),
+        format: str = Query("json", pattern="^(json|ndjson)$", description="json, or ndjson to stream rows as they are read")
+    ):
+        self.start = start
+        # A date-only end includes the whole day
+        self.end = f"{end} 23:59:59" if end and len(end) == 10 else end
+        self.name = name
+        self.cursor = cursor
+        self.offset = offset
+        self.limit = limit
+        self.format = format
+
+def load_records(kind: str, model, params: RecordQuery, filters: dict):
+    """Reads one page of records from the record store as models, with the cursor for the next page."""
+    records = []
+    last_id = None
+    for last_id, row in get_record_store().query(
+        kind, filters, params.start, params.end, params.cursor, params.offset, params.limit
+    ):
+        records.append(model(**row))
+    next_cursor = last_id if params.limit is not None and len(records) == params.limit else None
+    return records, next_cursor
+
+def stream_records(kind: str, params: RecordQuery, filters: dict):
+    """Yields records as NDJSON lines while they are read from the record store."""
+    for record_id, row in get_record_store().query(
+        kind, filters, params.start, params.end, params.cursor, params.offset, params.limit
+    ):
+        yield json.dumps({**row, "cursor": record_id}) + "\n"
+
+async def list_records(kind: str, model, params: RecordQuery, response: Response, filters: dict = None):
+    """Serve a record endpoint as a JSON page or an NDJSON stream."""
+    filters = dict(filters or {})
+    if params.name:
+        filters["name"] = params.name
+
+    if params.format == "ndjson":
+        return StreamingResponse(stream_records(kind, params, filters), media_type="application/x-ndjson")
+
+    records, next_cursor = await run_blocking(load_records, kind, model, params, filters)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+    return records
 
 # API endpoints
 @router.get("/sabineworders", response_model=List[OrderData])
-async def get_new_orders():
-    """Fetch all new orders from CSV"""
-    orders = []
-    file_path = 'customerrecords/neworder.csv'
-    if os.path.exists(file_path):
-        with open(file_path, 'r', newline='', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                orders.append(OrderData(**row))
-    return orders
+async def get_new_orders(response: Response, params: RecordQuery = Depends()):
+    """Fetch new orders"""
+    return await list_records("orders", OrderData, params, response)
 
 @router.get("/sabireturns", response_model=List[ReturnData])
-async def get_returns():
-    """Fetch all returns from CSV"""
-    returns = []
-    file_path = 'customerrecords/orderreturns.csv'
-    if os.path.exists(file_path):
-        with open(file_path, 'r', newline='', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                returns.append(ReturnData(**row))
-    return returns
+async def get_returns(
+    response: Response,
+    params: RecordQuery = Depends(),
+    order_number: Optional[str] = Query(None, description="Order number, e.g. GL78340824")
+):
+    """Fetch returns"""
+    filters = {"order_number": order_number} if order_number else {}
+    return await list_records("returns", ReturnData, params, response, filters)
 
 @router.get("/sabiissues", response_model=List[IssueData])
-async def get_issues():
-    """Returns all issue reports as JSON."""
+async def get_issues(response: Response, params: RecordQuery = Depends()):
+    """Returns issue reports as JSON."""
     try:
-        file_path = 'customerrecords/issues.csv'
-        if not os.path.exists(file_path):
-            return []
-        
-        issues = []
-        with open(file_path, 'r', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                issues.append(IssueData(**row))
-        return issues
+        return await list_records("issues", IssueData, params, response)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/sabicallbacks", response_model=List[CallbackData])
-async def get_callbacks():
-    """Returns all callback requests as JSON."""
+async def get_callbacks(response: Response, params: RecordQuery = Depends()):
+    """Returns callback requests as JSON."""
     try:
-        file_path = 'customerrecords/customerrecords.csv'
-        if not os.path.exists(file_path):
-            return []
-        
-        callbacks = []
-        with open(file_path, 'r', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                if row.get('reason') == "Requested Callback":
-                    callbacks.append(CallbackData(**row))
-        return callbacks
+        return await list_records("callbacks", CallbackData, params, response, {"reason": "Requested Callback"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/sabitracking", response_model=List[TrackOrderData])
-async def get_tracking():
-    """Fetch all tracking requests from CSV"""
-    tracking = []
-    file_path = 'customerrecords/trackorder.csv'
-    if os.path.exists(file_path):
-        with open(file_path, 'r', newline='', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                tracking.append(TrackOrderData(**row))
-    return tracking 
\ No newline at end of file
+async def get_tracking(
+    response: Response,
+    params: RecordQuery = Depends(),
+    order_number: Optional[str] = Query(None, description="Order number, e.g. GL78340824")
+):
+    """Fetch tracking requests"""
+    filters = {"order_number": order_number} if order_number else {}
+    return await list_records("tracking", TrackOrderData, params, response, filters)
@@ -0,0 +1,388 @@
+# scripts/benchmark_chatbot.py
+#
+# Offline end-to-end benchmark of the chatbot API. The OpenAI models are
+# replaced by the deterministic fakes in scripts/benchmark_fakes.py, synthetic
+# documents are generated for every app, and the FastAPI app is driven
+# in-process, so no network or API key is needed.
+#
+# Reported:
+#   /chatbot throughput and p50/p95/p99 latency per app and per Sabi intent
+#   CSV and SQLite record writer throughput
+#   Record endpoint throughput (paginated JSON and NDJSON)
+#
+# Run from the project root: python -m scripts.benchmark_chatbot
+# Everything is written to a temporary working directory (see --workdir).
+# Save a run with --output and pass it as --baseline to a later run: the exit
+# code is 1 if any p95 latency or throughput regressed beyond --tolerance.
+
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import threading
+import numpy as np
+from collections import defaultdict
+from scripts.benchmark_intents import SAMPLE_QUERIES
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APPS = ("sabi", "trace", "katsu")
+
+# Documents folder of each app, relative to the working directory (see services/index_store.py)
+APP_DOCUMENTS = {
+    "sabi": "documents/sabiMarket",
+    "trace": "documents/trace",
+    "katsu": "documents/katsu"
+}
+
+TOPICS = {
+    "sabi": ["delivery", "payment", "rice", "milk", "noodles", "returns", "discounts", "store hours"],
+    "trace": ["shipment", "customs", "warehouse", "pickup", "insurance", "invoice", "route", "pallet"],
+    "katsu": ["menu", "reservation", "allergens", "catering", "opening hours", "gift card", "parking", "takeaway"]
+}
+QUESTION_TEMPLATES = [
+    "How does {topic} work for item {n}?",
+    "What is the policy on {topic} number {n}?",
+    "Can I change my {topic} for case {n}?",
+    "Is {topic} available in area {n}?",
+]
+
+
+def generate_corpus(app: str, documents: int, pairs: int, seed: int = 0) -> list:
+    """Writes synthetic Q&A documents for an app and returns their questions."""
+    rng = np.random.default_rng(seed + APPS.index(app))
+    folder = APP_DOCUMENTS[app]
+    os.makedirs(folder, exist_ok=True)
+    questions = []
+    for d in range(documents):
+        lines = []
+        for p in range(pairs):
+            topic = TOPICS[app][rng.integers(len(TOPICS[app]))]
+            n = d * pairs + p
+            question = QUESTION_TEMPLATES[rng.integers(len(QUESTION_TEMPLATES))].format(topic=topic, n=n)
+            answer = " ".join(
+                f"For {topic} {n}, customers should expect step {s} to take {rng.integers(1, 48)} hours."
+                for s in range(1, 4)
+            )
+            lines.append(f"Q: {question}\nA: {answer}\n")
+            questions.append(question)
+        with open(os.path.join(folder, f"{app}_faq_{d:03d}.txt"), "w", encoding="utf-8") as file:
+            file.write("\n".join(lines))
+    return questions
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies: list, elapsed: float = None, errors: int = 0) -> dict:
+    values = sorted(latencies)
+    summary = {
+        "requests": len(values),
+        "errors": errors,
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2)
+    }
+    if elapsed:
+        summary["throughput_rps"] = round(len(values) / elapsed, 2)
+    return summary
+
+
+async def run_load(client, payloads: list, concurrency: int) -> tuple:
+    """Posts every payload to /chatbot with `concurrency` requests in flight.
+
+    Returns ([(payload, seconds, status)], elapsed seconds).
+    """
+    results = []
+    pending = iter(payloads)
+
+    async def worker():
+        for payload in pending:
+            started = time.perf_counter()
+            response = await client.post("/chatbot", json=payload)
+            results.append((payload, time.perf_counter() - started, response.status_code))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results, time.perf_counter() - started
+
+
+def app_payloads(app: str, questions: list, count: int, distinct: int) -> list:
+    """Cycles through `distinct` corpus questions, so repeats exercise the caches."""
+    questions = questions[:distinct]
+    return [
+        {"app": app, "query": questions[i % len(questions)], "name": f"bench-{app}-{i}",
+         "address": "1 Benchmark Road, Lagos"}
+        for i in range(count)
+    ]
+
+
+async def bench_chatbot(client, corpora: dict, args) -> dict:
+    results = {}
+    for app in APPS:
+        payloads = app_payloads(app, corpora[app], args.requests, args.distinct_queries)
+        runs, elapsed = await run_load(client, payloads, args.concurrency)
+        errors = sum(1 for _, _, status in runs if status != 200)
+        results[app] = summarize([seconds for _, seconds, _ in runs], elapsed, errors)
+    return results
+
+
+async def bench_sabi_intents(client, args) -> dict:
+    from services.intent_router import classify_intent
+
+    # Each request gets its own customer, so no pending follow-up changes the intent
+    payloads = [
+        {"app": "sabi", "query": SAMPLE_QUERIES[i % len(SAMPLE_QUERIES)], "name": f"bench-intent-{i}",
+         "address": "1 Benchmark Road, Lagos"}
+        for i in range(args.intent_requests)
+    ]
+    runs, _ = await run_load(client, payloads, args.concurrency)
+
+    by_intent = defaultdict(list)
+    errors = defaultdict(int)
+    for payload, seconds, status in runs:
+        intent = classify_intent(payload["query"]).intent
+        by_intent[intent].append(seconds)
+        errors[intent] += status != 200
+    return {intent: summarize(latencies, errors=errors[intent]) for intent, latencies in sorted(by_intent.items())}
+
+
+def bench_record_writer(rows: int, threads: int) -> dict:
+    """Rows per second appended from several threads and written to disk.
+
+    The rate counts only the rows the writer actually wrote; rows refused
+    because its queue was full are reported separately.
+    """
+    from functions.record_store import RECORD_TYPES, SQLiteRecordStore
+    from functions.record_writer import CSVRecordSink, RecordQueueFull
+    from services.metrics import RECORD_ROWS, RECORD_ROWS_REJECTED
+
+    record_type = RECORD_TYPES["orders"]
+    sinks = {
+        "csv": (CSVRecordSink(), "customerrecords/bench_orders.csv"),
+        # The store creates the tables its sink writes to
+        "sqlite": (SQLiteRecordStore("customerrecords/bench.sqlite3").sink, record_type["table"])
+    }
+    results = {}
+    for store, (sink, target) in sinks.items():
+        target_name = os.path.basename(target)
+        written_before = RECORD_ROWS.value(store, target_name)
+        rejected_before = RECORD_ROWS_REJECTED.value(store)
+
+        def append_rows(start):
+            for i in range(start, rows, threads):
+                try:
+                    sink.append(target, record_type["columns"],
+                                [f"2024-01-01 00:00:{i % 60:02d}", f"customer {i}", "Rice (2 packs)", "Lagos"])
+                except RecordQueueFull:
+                    pass
+
+        workers = [threading.Thread(target=append_rows, args=(t,)) for t in range(threads)]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        sink.flush()
+        elapsed = time.perf_counter() - started
+        sink.close()
+        written = int(RECORD_ROWS.value(store, target_name) - written_before)
+        rejected = int(RECORD_ROWS_REJECTED.value(store) - rejected_before)
+        results[store] = {"rows": written, "rejected": rejected, "rows_per_second": round(written / elapsed, 1)}
+    return results
+
+
+async def bench_record_endpoint(client, records: int, page_size: int) -> dict:
+    """Reads every seeded order through /sabi/sabineworders, page by page and as NDJSON."""
+    from functions.record_store import get_record_store
+
+    store = get_record_store()
+    for i in range(records):
+        store.append("orders", [f"2024-01-01 00:{(i // 60) % 60:02d}:{i % 60:02d}", f"customer {i}",
+                                "Milo (3 cans)", "Lagos"])
+    store.sink.flush()
+
+    started = time.perf_counter()
+    pages = rows = 0
+    cursor = None
+    while True:
+        params = {"limit": page_size}
+        if cursor is not None:
+            params["cursor"] = cursor
+        response = await client.get("/sabi/sabineworders", params=params)
+        pages += 1
+        rows += len(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    paged = time.perf_counter() - started
+
+    started = time.perf_counter()
+    ndjson_rows = 0
+    async with client.stream("GET", "/sabi/sabineworders", params={"format": "ndjson"}) as response:
+        async for line in response.aiter_lines():
+            ndjson_rows += bool(line.strip())
+    streamed = time.perf_counter() - started
+
+    return {
+        "json_pages": {"rows": rows, "pages": pages, "rows_per_second": round(rows / paged, 1),
+                       "pages_per_second": round(pages / paged, 1)},
+        "ndjson": {"rows": ndjson_rows, "rows_per_second": round(ndjson_rows / streamed, 1)}
+    }
+
+
+def stage_means() -> dict:
+    """Mean duration of each recorded stage per app, in milliseconds."""
+    from services.metrics import STAGE_SECONDS
+    return {
+        f"{app}/{stage}": round(total / count * 1000, 2)
+        for (app, stage), (_, total, count) in sorted(STAGE_SECONDS._values.items()) if count
+    }
+
+
+async def run(args, corpora: dict) -> dict:
+    import httpx
+    from app.chatbot_api import app
+
+    await app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            results = {"chatbot": await bench_chatbot(client, corpora, args)}
+            results["sabi_intents"] = await bench_sabi_intents(client, args)
+            results["record_endpoint"] = await bench_record_endpoint(client, args.records, args.page_size)
+    finally:
+        await app.router.shutdown()
+    return results
+
+
+def regressions(baseline: dict, current: dict, tolerance: float, path: str = "") -> list:
+    """Lists the p95 latencies that grew, and the throughputs that fell, by more than `tolerance`.
+
+    Rejected record rows are listed whenever there are more than in the baseline.
+    """
+    found = []
+    for key, old in baseline.items():
+        new = current.get(key)
+        name = f"{path}/{key}" if path else key
+        if isinstance(old, dict) and isinstance(new, dict):
+            found.extend(regressions(old, new, tolerance, name))
+        elif key == "rejected" and isinstance(new, int) and new > old:
+            found.append(f"{name}: {old} -> {new}")
+        elif not isinstance(new, (int, float)) or not old:
+            continue
+        elif key == "p95_ms" and new > old * (1 + tolerance):
+            found.append(f"{name}: {old} -> {new}")
+        elif (key.endswith("_per_second") or key == "throughput_rps") and new < old * (1 - tolerance):
+            found.append(f"{name}: {old} -> {new}")
+    return found
+
+
+def print_report(results: dict):
+    print(f"\n{'/chatbot':<22}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for app, row in results["chatbot"].items():
+        print(f"{app:<22}{row['throughput_rps']:>9}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}{row['errors']:>8}")
+
+    print(f"\n{'sabi intent':<22}{'n':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for intent, row in results["sabi_intents"].items():
+        print(f"{intent:<22}{row['requests']:>9}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}{row['errors']:>8}")
+
+    print("\nrecord writer")
+    for store, row in results["record_writer"].items():
+        print(f"  {store:<20}{row['rows_per_second']:>12} rows/s  ({row['rows']} written, {row['rejected']} rejected)")
+    print("record endpoint")
+    for mode, row in results["record_endpoint"].items():
+        print(f"  {mode:<20}{row['rows_per_second']:>12} rows/s  ({row['rows']} rows)")
+
+    print("\nmean stage durations (ms)")
+    for stage, ms in results["stages"].items():
+        print(f"  {stage:<30}{ms:>10}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline chatbot benchmark with fake models")
+    parser.add_argument("--requests", type=int, default=200, help="/chatbot requests per app")
+    parser.add_argument("--intent-requests", type=int, default=220, help="Sabi requests across the sample intents")
+    parser.add_argument("--concurrency", type=int, default=20, help="Requests in flight")
+    parser.add_argument("--distinct-queries", type=int, default=50, help="Distinct questions per app")
+    parser.add_argument("--documents", type=int, default=20, help="Synthetic documents per app")
+    parser.add_argument("--pairs", type=int, default=25, help="Q&A pairs per document")
+    parser.add_argument("--llm-latency", type=float, default=200, help="LLM time to first token (ms)")
+    parser.add_argument("--token-latency", type=float, default=5, help="LLM time per further token (ms)")
+    parser.add_argument("--embedding-latency", type=float, default=20, help="Embedding call latency (ms)")
+    parser.add_argument("--improvement-mode", default=None,
+                        help="RESPONSE_IMPROVEMENT_MODE for the run (default: the environment's)")
+    parser.add_argument("--writer-rows", type=int, default=10000,
+                        help="Rows for the record writer benchmark (more than RECORD_QUEUE_SIZE may be rejected)")
+    parser.add_argument("--writer-threads", type=int, default=4, help="Threads appending records")
+    parser.add_argument("--records", type=int, default=5000, help="Orders seeded for the record endpoint")
+    parser.add_argument("--page-size", type=int, default=500, help="Page size when reading records")
+    parser.add_argument("--workdir", help="Working directory for documents, indexes and records (default: temporary)")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Results JSON of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression against the baseline")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+
+    # Services resolve their data paths against the working directory, and read
+    # their settings from the environment on import
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="chatbot-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    if not os.path.exists(os.path.join(workdir, "templates")):
+        shutil.copytree(os.path.join(PROJECT_ROOT, "templates"), os.path.join(workdir, "templates"))
+    os.chdir(workdir)
+    os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+    # tiktoken downloads its encodings on first use
+    os.environ.setdefault("CHUNK_TOKENIZER", "estimate")
+    if args.improvement_mode:
+        os.environ["RESPONSE_IMPROVEMENT_MODE"] = args.improvement_mode
+
+    from scripts.benchmark_fakes import install_fake_models
+    install_fake_models(
+        llm_latency=args.llm_latency / 1000, token_latency=args.token_latency / 1000,
+        embedding_latency=args.embedding_latency / 1000
+    )
+
+    corpora = {app: generate_corpus(app, args.documents, args.pairs) for app in APPS}
+    print(f"Working directory: {workdir}")
+    print(f"Corpus: {args.documents} documents x {args.pairs} Q&A pairs per app; "
+          f"{args.requests} requests per app at concurrency {args.concurrency}")
+
+    started = time.perf_counter()
+    results = asyncio.run(run(args, corpora))
+    results["record_writer"] = bench_record_writer(args.writer_rows, args.writer_threads)
+    results["stages"] = stage_means()
+    results["config"] = {key: value for key, value in vars(args).items()
+                         if key not in ("workdir", "output", "baseline")}
+    print_report(results)
+    print(f"\nTotal: {time.perf_counter() - started:.1f}s")
+
+    if output:
+        with open(output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+    if baseline:
+        with open(baseline, encoding="utf-8") as file:
+            found = regressions(json.load(file), results, args.tolerance)
+        for line in found:
+            print(f"REGRESSION: {line}")
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
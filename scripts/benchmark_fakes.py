@@ -0,0 +1,177 @@
+# scripts/benchmark_fakes.py
+#
+# Deterministic stand-ins for the OpenAI models, so the chatbot can be
+# benchmarked offline. Outputs depend only on the input text, and every call
+# sleeps for a configurable latency to mimic the network round trip.
+
+import time
+import asyncio
+import hashlib
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.llms import BaseLLM
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import Generation, LLMResult, ChatGeneration, ChatGenerationChunk, ChatResult
+
+WORDS = (
+    "we deliver orders across lagos and abuja within two working days and you can pay by card "
+    "transfer or cash on delivery our support team is available every day to help with returns "
+    "refunds tracking and product questions"
+).split()
+
+
+def _seed(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+
+
+def fake_answer(prompt: str, tokens: int) -> list:
+    """Returns the answer tokens (words with their leading space) for a prompt."""
+    rng = np.random.default_rng(_seed(prompt))
+    words = rng.choice(WORDS, size=tokens)
+    return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+
+def _usage(prompt: str, tokens: int) -> dict:
+    prompt_tokens = max(1, len(prompt) // 4)
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": tokens,
+            "total_tokens": prompt_tokens + tokens}
+
+
+class FakeEmbeddings(Embeddings):
+    """Unit vectors seeded by a hash of each text; one latency sleep per call."""
+
+    def __init__(self, size: int = 256, latency: float = 0.02):
+        self.size = size
+        self.latency = latency
+        self.model = f"fake-embedding-{size}"
+        self.calls = 0
+
+    def _vector(self, text: str) -> list:
+        vector = np.random.default_rng(_seed(text)).standard_normal(self.size)
+        return (vector / np.linalg.norm(vector)).astype(np.float32).tolist()
+
+    def embed_documents(self, texts: list) -> list:
+        self.calls += 1
+        time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> list:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: list) -> list:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> list:
+        return (await self.aembed_documents([text]))[0]
+
+
+class FakeLLM(BaseLLM):
+    """Completion model that waits `latency` seconds for the first token and
+    `token_latency` per further token, reporting OpenAI-style token usage."""
+
+    latency: float = 0.2
+    token_latency: float = 0.005
+    tokens: int = 40
+    streaming: bool = False
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-llm"
+
+    def _generate(self, prompts, stop=None, run_manager=None, **kwargs) -> LLMResult:
+        generations = []
+        usage = {}
+        for prompt in prompts:
+            tokens = fake_answer(prompt, self.tokens)
+            time.sleep(self.latency + self.token_latency * (len(tokens) - 1))
+            generations.append([Generation(text="".join(tokens))])
+            for key, value in _usage(prompt, len(tokens)).items():
+                usage[key] = usage.get(key, 0) + value
+        return LLMResult(generations=generations, llm_output={"token_usage": usage})
+
+    async def _agenerate(self, prompts, stop=None, run_manager=None, **kwargs) -> LLMResult:
+        generations = []
+        usage = {}
+        for prompt in prompts:
+            tokens = fake_answer(prompt, self.tokens)
+            await asyncio.sleep(self.latency)
+            for i, token in enumerate(tokens):
+                if i:
+                    await asyncio.sleep(self.token_latency)
+                if self.streaming and run_manager:
+                    await run_manager.on_llm_new_token(token)
+            generations.append([Generation(text="".join(tokens))])
+            for key, value in _usage(prompt, len(tokens)).items():
+                usage[key] = usage.get(key, 0) + value
+        return LLMResult(generations=generations, llm_output={"token_usage": usage})
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model with the same latency shape as FakeLLM; the last streamed
+    chunk carries usage metadata, as ChatOpenAI does with stream_usage."""
+
+    latency: float = 0.2
+    token_latency: float = 0.005
+    tokens: int = 40
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    @staticmethod
+    def _prompt(messages) -> str:
+        return "\n".join(str(message.content) for message in messages)
+
+    def _result(self, prompt: str, tokens: list) -> ChatResult:
+        usage = _usage(prompt, len(tokens))
+        message = AIMessage(content="".join(tokens), usage_metadata={
+            "input_tokens": usage["prompt_tokens"], "output_tokens": usage["completion_tokens"],
+            "total_tokens": usage["total_tokens"]
+        })
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        prompt = self._prompt(messages)
+        tokens = fake_answer(prompt, self.tokens)
+        time.sleep(self.latency + self.token_latency * (len(tokens) - 1))
+        return self._result(prompt, tokens)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        prompt = self._prompt(messages)
+        tokens = fake_answer(prompt, self.tokens)
+        await asyncio.sleep(self.latency + self.token_latency * (len(tokens) - 1))
+        return self._result(prompt, tokens)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        prompt = self._prompt(messages)
+        tokens = fake_answer(prompt, self.tokens)
+        await asyncio.sleep(self.latency)
+        for i, token in enumerate(tokens):
+            if i:
+                await asyncio.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+        usage = _usage(prompt, len(tokens))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata={
+            "input_tokens": usage["prompt_tokens"], "output_tokens": usage["completion_tokens"],
+            "total_tokens": usage["total_tokens"]
+        }))
+
+
+def install_fake_models(llm_latency: float = 0.2, token_latency: float = 0.005, embedding_latency: float = 0.02,
+                        tokens: int = 40, embedding_size: int = 256, cache_path: str = "cache/embeddings.sqlite3"):
+    """Registers the fakes as the process-wide model clients used by every service."""
+    from services.model_clients import set_client
+    from services.embedding_cache import CachedEmbeddings
+
+    embeddings = CachedEmbeddings(FakeEmbeddings(embedding_size, embedding_latency), cache_path=cache_path)
+    set_client("embeddings", embeddings)
+    set_client("llm", FakeLLM(latency=llm_latency, token_latency=token_latency, tokens=tokens))
+    set_client("llm_stream", FakeLLM(latency=llm_latency, token_latency=token_latency, tokens=tokens, streaming=True))
+    set_client("chat_llm", FakeChatModel(latency=llm_latency, token_latency=token_latency, tokens=tokens))
+    return embeddings
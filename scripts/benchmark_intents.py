@@ -0,0 +1,101 @@
+# scripts/benchmark_intents.py
+#
+# Micro-benchmark for the Sabi intent router.
+# Run from the project root: python -m scripts.benchmark_intents
+
+import re
+import sys
+import timeit
+from services.intent_router import classify_intent
+
+# Representative WhatsApp queries covering every intent
+SAMPLE_QUERIES = [
+    "I want to order Milo (3 cans), 5alive drink (1 pack)",
+    "Rice (2 packs), Peak milk (6 cans)",
+    "I want to buy something",
+    "Can I get some groceries delivered?",
+    "Where is my order?",
+    "Track order GL09395824",
+    "What is the status of my delivery",
+    "GL78340824 Wrong size delivered",
+    "Order Number: GL78340824 Reason: Wrong size delivered",
+    "I want to return an item",
+    "How do I get a refund?",
+    "I have an issue with my last order",
+    "The product was damaged, there is a problem",
+    "Please call me back on 08012345678",
+    "Can someone contact me",
+    "My phone number is 080-1234-5678",
+    "09033268428",
+    "What are your delivery times?",
+    "Do you deliver to Abuja?",
+    "What payment methods do you accept?",
+    "Hello",
+    "Thanks a lot!",
+]
+
+
+def legacy_classify(query):
+    """The original chain of keyword scans and regexes from handle_sabi_query, for comparison."""
+    order_keywords = ["order", "buy", "purchase", "want", "need", "get"]
+    track_keywords = ["track", "where", "status", "follow"]
+    return_keywords = ["return", "exchange", "refund", "reason"]
+    issue_keywords = ["issue", "problem", "complaint", "wrong"]
+    callback_keywords = ["callback", "call back", "call me", "contact me"]
+
+    query_lower = query.lower()
+    order_number_match = re.search(r'[A-Z]{2}\d{8}', query)
+    if order_number_match:
+        order_number = order_number_match.group()
+        reason_start = query.find(order_number) + len(order_number)
+        if query[reason_start:].strip():
+            return "return_request"
+    if any(keyword in query_lower for keyword in return_keywords):
+        return "return_prompt"
+    elif any(keyword in query_lower for keyword in track_keywords):
+        if re.search(r'[A-Z]{2}\d{8}', query):
+            return "track_order"
+        return "track_prompt"
+    elif any(keyword in query_lower for keyword in issue_keywords):
+        return "issue_report"
+    elif any(keyword in query_lower for keyword in callback_keywords) or "phone" in query_lower:
+        if re.search(r'(?:\d{11})|(?:\d{3}[-\s]?\d{4}[-\s]?\d{4})', query):
+            return "callback_request"
+        return "callback_prompt"
+    elif re.search(r'(?:\d{11})|(?:\d{3}[-\s]?\d{4}[-\s]?\d{4})', query):
+        return "phone_callback"
+    elif any(keyword in query_lower for keyword in order_keywords) or re.search(r'\(\d+\s*(?:pack|packs|can|cans|bottle|bottles)\)', query_lower):
+        if re.findall(r'([^()]+)\s*\((\d+)\s*(?:pack|packs|can|cans|bottle|bottles)\)', query):
+            return "new_order"
+        return "order_prompt"
+    return "question"
+
+
+def check_parity(queries):
+    """Returns the queries where the router disagrees with the original logic."""
+    return [q for q in queries if classify_intent(q).intent != legacy_classify(q)]
+
+
+def bench(func, queries, number):
+    """Returns microseconds per query for func over the corpus."""
+    seconds = timeit.timeit(lambda: [func(q) for q in queries], number=number)
+    return seconds / (number * len(queries)) * 1e6
+
+
+def main(number=2000):
+    mismatches = check_parity(SAMPLE_QUERIES)
+    for query in mismatches:
+        print(f"MISMATCH: {query!r}: router={classify_intent(query).intent} legacy={legacy_classify(query)}")
+
+    legacy_us = bench(legacy_classify, SAMPLE_QUERIES, number)
+    router_us = bench(classify_intent, SAMPLE_QUERIES, number)
+    print(f"Queries: {len(SAMPLE_QUERIES)} x {number} rounds")
+    print(f"Legacy keyword scans: {legacy_us:.2f} us/query")
+    print(f"Intent router:        {router_us:.2f} us/query (includes entity extraction)")
+    print(f"Speedup:              {legacy_us / router_us:.2f}x")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    sys.exit(main(rounds))
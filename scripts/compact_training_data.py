@@ -0,0 +1,35 @@
+# scripts/compact_training_data.py
+#
+# Merges the rotated segments of every training-data log into one compressed
+# segment, keeping only the latest entry for each normalized query.
+# Safe to run while the API is serving: new entries go to a fresh active file.
+# Run from the project root: python -m scripts.compact_training_data [app ...]
+
+import sys
+import argparse
+from services.training_log import compact_log
+from scripts.improve_responses import normalize_query, training_file, improved_responses_file
+
+
+def compact_app(app: str) -> dict:
+    """Compacts the training and improved-response logs of an app. Returns (read, kept) per log."""
+    results = {}
+    for log_file in (training_file(app), improved_responses_file(app)):
+        results[log_file] = compact_log(log_file, lambda entry: normalize_query(entry.get("query", "")))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Deduplicate the training-data logs by normalized query")
+    parser.add_argument("apps", nargs="*", default=["sabi", "trace", "katsu"])
+    args = parser.parse_args(argv)
+
+    for app in args.apps:
+        for log_file, (read, kept) in compact_app(app).items():
+            if read:
+                print(f"{log_file}: {read} entries -> {kept}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+# scripts/feedback_analytics.py
+#
+# Columnar analytics over the feedback CSVs (feedback/<app>_feedback.csv):
+# approval rates per time window and clusters of similar negatively rated
+# queries, written as a compact JSON report per app.
+# Run from the project root: python -m scripts.feedback_analytics [app ...] [--window 1D]
+#
+# pandas, pyarrow and scikit-learn are imported on first use so the API
+# process, which imports scripts.improve_responses, does not load them.
+
+import os
+import sys
+import json
+import time
+import argparse
+
+# Rows per chunk read from a feedback CSV
+FEEDBACK_CHUNK_ROWS = int(os.getenv("FEEDBACK_CHUNK_ROWS", "500000"))
+# Most frequent distinct negative queries clustered, and the cosine similarity joining two of them
+FEEDBACK_CLUSTER_MAX = int(os.getenv("FEEDBACK_CLUSTER_MAX", "5000"))
+FEEDBACK_CLUSTER_THRESHOLD = float(os.getenv("FEEDBACK_CLUSTER_THRESHOLD", "0.5"))
+
+POSITIVE = '👍'
+COLUMNS = ["timestamp", "query", "rating"]
+
+
+def feedback_file(app: str) -> str:
+    return f'feedback/{app}_feedback.csv'
+
+
+def report_file(app: str) -> str:
+    return f'feedback/{app}_feedback_report.json'
+
+
+def read_feedback(app: str, chunk_rows: int = FEEDBACK_CHUNK_ROWS):
+    """Yields DataFrames of (timestamp, query, rating) string columns from an app's feedback CSV.
+
+    Uses pyarrow's streaming CSV reader when it is installed, else chunked pandas reads.
+    """
+    import pandas as pd
+
+    path = feedback_file(app)
+    if not os.path.exists(path):
+        return
+    try:
+        import pyarrow as pa
+        from pyarrow import csv as pa_csv
+    except ImportError:
+        pa_csv = None
+
+    if pa_csv is not None:
+        # Roughly chunk_rows rows per block at ~200 bytes per row
+        reader = pa_csv.open_csv(
+            path,
+            read_options=pa_csv.ReadOptions(block_size=max(1 << 20, chunk_rows * 200)),
+            parse_options=pa_csv.ParseOptions(newlines_in_values=True, invalid_row_handler=lambda row: "skip"),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=COLUMNS, column_types={column: pa.string() for column in COLUMNS}
+            )
+        )
+        for batch in reader:
+            yield batch.to_pandas()
+        return
+
+    for chunk in pd.read_csv(path, usecols=COLUMNS, dtype=str, chunksize=chunk_rows,
+                             on_bad_lines="skip", keep_default_na=False, encoding="utf-8"):
+        yield chunk
+
+
+def normalize_queries(queries):
+    """Vectorised scripts.improve_responses.normalize_query over a pandas Index or Series."""
+    return (queries.str.lower()
+            .str.replace(r'[^\w\s]', ' ', regex=True)
+            .str.replace(r'\s+', ' ', regex=True)
+            .str.strip())
+
+
+def parse_timestamps(values):
+    """Parses ISO 8601 timestamps to UTC, with Arrow's parser when every value allows it."""
+    import pandas as pd
+    try:
+        import pyarrow as pa
+        parsed = pa.array(values, type=pa.string()).cast(pa.timestamp("us", tz="UTC"))
+        return pd.Series(parsed.to_pandas(), index=values.index)
+    except (ImportError, ValueError, TypeError):
+        # ArrowInvalid is a ValueError; pandas also accepts dates and other offsets
+        return pd.to_datetime(values, errors="coerce", utc=True, format="ISO8601")
+
+
+def approval_windows(chunks, window: str = "1D"):
+    """Returns (window counts DataFrame indexed by window start with total/approved/rate, negative query counts).
+
+    Both are accumulated chunk by chunk, so memory grows with the number of
+    windows and distinct negative queries rather than with the rows.
+    """
+    import pandas as pd
+
+    totals = []
+    negatives = []
+    for chunk in chunks:
+        timestamps = parse_timestamps(chunk["timestamp"])
+        approved = chunk["rating"].str.strip() == POSITIVE
+        frame = pd.DataFrame({"window": timestamps.dt.floor(window), "approved": approved}).dropna(subset=["window"])
+        totals.append(frame.groupby("window")["approved"].agg(["size", "sum"]))
+
+        queries = chunk.loc[~approved, "query"].dropna()
+        # Normalise each distinct query once rather than every row
+        counts = queries.value_counts()
+        counts.index = normalize_queries(counts.index)
+        negatives.append(counts.groupby(level=0).sum())
+
+    if not totals:
+        return pd.DataFrame(columns=["total", "approved", "rate"]), pd.Series(dtype="int64")
+    windows = pd.concat(totals).groupby(level=0).sum().rename(columns={"size": "total", "sum": "approved"})
+    windows["rate"] = windows["approved"] / windows["total"]
+    negative_counts = pd.concat(negatives).groupby(level=0).sum().sort_values(ascending=False)
+    negative_counts = negative_counts[negative_counts.index != ""]
+    return windows.sort_index(), negative_counts
+
+
+def cluster_queries(query_counts, threshold: float = FEEDBACK_CLUSTER_THRESHOLD,
+                    max_queries: int = FEEDBACK_CLUSTER_MAX, limit: int = None) -> list:
+    """Groups similar queries: TF-IDF vectors, one sparse similarity matrix, and its connected components.
+
+    `query_counts` is a Series of counts indexed by normalised query. Returns
+    clusters sorted by total count (the largest `limit`), each with its most
+    frequent query and top terms.
+    """
+    import numpy as np
+    from scipy.sparse.csgraph import connected_components
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    query_counts = query_counts.head(max_queries)
+    if len(query_counts) == 0:
+        return []
+    queries = list(query_counts.index)
+    counts = query_counts.to_numpy()
+
+    vectorizer = TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True)
+    try:
+        vectors = vectorizer.fit_transform(queries)
+    except ValueError:  # only stop words or empty queries
+        return []
+    # Rows are L2-normalised, so the product holds cosine similarities
+    similarity = (vectors @ vectors.T).tocsr()
+    similarity.data[similarity.data < threshold] = 0
+    similarity.eliminate_zeros()
+    cluster_count, labels = connected_components(similarity, directed=False)
+
+    terms = np.asarray(vectorizer.get_feature_names_out())
+    totals = np.bincount(labels, weights=counts, minlength=cluster_count)
+    sizes = np.bincount(labels, minlength=cluster_count)
+    clusters = []
+    for label in np.argsort(-totals, kind="stable")[:limit]:
+        members = np.flatnonzero(labels == label)
+        # Queries are sorted by count, so the first member is the most frequent
+        weights = np.asarray(vectors[members].multiply(counts[members][:, None]).sum(axis=0)).ravel()
+        clusters.append({
+            "query": queries[members[0]],
+            "count": int(totals[label]),
+            "distinct_queries": int(sizes[label]),
+            "terms": terms[np.argsort(-weights)[:3]].tolist(),
+            "examples": [queries[i] for i in members[1:4]]
+        })
+    return clusters
+
+
+def feedback_report(app: str, window: str = "1D", recent_windows: int = 30, top_clusters: int = 20) -> dict:
+    """Builds the feedback report of an app."""
+    started = time.perf_counter()
+    windows, negative_counts = approval_windows(read_feedback(app), window)
+    total = int(windows["total"].sum()) if len(windows) else 0
+    approved = int(windows["approved"].sum()) if len(windows) else 0
+    clusters = cluster_queries(negative_counts, limit=top_clusters)
+
+    recent = windows.tail(recent_windows)
+    return {
+        "app": app,
+        "generated": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "window": window,
+        "total": total,
+        "approved": approved,
+        "approval_rate": round(approved / total, 4) if total else None,
+        "windows": [
+            {"start": start.isoformat(), "total": int(row.total), "approved": int(row.approved),
+             "rate": round(float(row.rate), 4)}
+            for start, row in zip(recent.index, recent.itertuples())
+        ],
+        "negative_queries": int(negative_counts.sum()) if len(negative_counts) else 0,
+        "negative_clusters": clusters,
+        "seconds": round(time.perf_counter() - started, 3)
+    }
+
+
+def write_report(app: str, report: dict) -> str:
+    """Writes a report next to the app's feedback file and returns its path."""
+    path = report_file(app)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, separators=(",", ":"))
+    return path
+
+
+def print_report(report: dict):
+    if not report["total"]:
+        print(f"No feedback data found for {report['app']}")
+        return
+    print(f"Analysis for {report['app']} ({report['seconds']}s):")
+    print(f"Total feedback entries: {report['total']}")
+    print(f"Approval rate: {report['approval_rate']:.1%} ({report['approved']} positive)")
+    for window in report["windows"][-7:]:
+        print(f"  {window['start'][:16]}  {window['rate']:.1%} of {window['total']}")
+    print(f"Negative feedback: {report['negative_queries']} in {len(report['negative_clusters'])} top clusters")
+    for cluster in report["negative_clusters"][:5]:
+        print(f"  {cluster['count']:>7}  {cluster['query']!r}  [{', '.join(cluster['terms'])}]")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Feedback approval rates and negative query clusters")
+    parser.add_argument("apps", nargs="*", default=["sabi", "trace", "katsu"])
+    parser.add_argument("--window", default="1D", help="pandas frequency of the approval windows, e.g. 1h, 1D, 7D")
+    args = parser.parse_args(argv)
+
+    for app in args.apps:
+        report = feedback_report(app, args.window)
+        print_report(report)
+        if report["total"]:
+            print(f"Report written to {write_report(app, report)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
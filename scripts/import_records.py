@@ -0,0 +1,65 @@
+# scripts/import_records.py
+#
+# One-shot import of the customer record CSVs into the SQLite record store.
+# Run from the project root: python -m scripts.import_records [--db PATH] [--replace]
+
+import os
+import csv
+import sqlite3
+import argparse
+from functions.record_store import RECORD_TYPES, RECORD_DB_PATH, SQLiteRecordStore
+
+BATCH_SIZE = 10000
+
+
+def read_csv_rows(file_path: str, columns: list):
+    """Yields CSV rows as value lists in the given column order."""
+    with open(file_path, 'r', newline='', encoding='utf-8') as file:
+        for row in csv.DictReader(file):
+            yield [row.get(column, "") for column in columns]
+
+
+def import_records(db_path: str = RECORD_DB_PATH, replace: bool = False) -> dict:
+    """Copies every record CSV into the SQLite store. Returns the rows imported per record type."""
+    store = SQLiteRecordStore(db_path)
+    imported = {}
+    try:
+        for kind, record_type in RECORD_TYPES.items():
+            file_path = record_type["file"]
+            if not os.path.exists(file_path):
+                print(f"Skipping {kind}: {file_path} not found")
+                continue
+
+            existing = store.count(kind)
+            if existing and not replace:
+                print(f"Skipping {kind}: table already has {existing} rows (use --replace to overwrite)")
+                continue
+            if existing:
+                db = sqlite3.connect(db_path)
+                with db:
+                    db.execute(f"DELETE FROM {record_type['table']}")
+                db.close()
+
+            total = 0
+            batch = []
+            for row in read_csv_rows(file_path, record_type["columns"]):
+                batch.append(row)
+                if len(batch) >= BATCH_SIZE:
+                    total += store.insert_many(kind, batch)
+                    batch = []
+            if batch:
+                total += store.insert_many(kind, batch)
+
+            imported[kind] = total
+            print(f"Imported {total} {kind} records from {file_path}")
+    finally:
+        store.close()
+    return imported
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import customer record CSVs into SQLite")
+    parser.add_argument("--db", default=RECORD_DB_PATH, help="SQLite database path")
+    parser.add_argument("--replace", action="store_true", help="Replace rows already in the database")
+    args = parser.parse_args()
+    import_records(args.db, args.replace)
@@ -1,29 +1,30 @@
-import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 import os
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
-import json
+import re
+import asyncio
+import hashlib
+import threading
 from datetime import datetime
-import csv
+from services.executor import run_blocking
+from services.model_clients import get_chat_llm, CHAT_MODEL
+from services.feedback_index import get_feedback_index
+from services.training_log import append_entry, read_log
+from functions.record_writer import RecordQueueFull
+from services.metrics import timed, record_cache_lookup, record_tokens
 
-# Load environment variables
-openai_api_key = os.getenv("OPENAI_API_KEY")
+# How answers are improved before they are returned:
+#   full   - a second LLM call rewrites every answer (default)
+#   cached - reuse a stored improved response for the same query, else rewrite
+#   fused  - the RetrievalQA prompt applies the style guidance itself, no second call
+#   off    - answers are returned as generated
+IMPROVEMENT_MODES = ("full", "cached", "fused", "off")
+IMPROVEMENT_MODE = os.getenv("RESPONSE_IMPROVEMENT_MODE", "full").lower()
+if IMPROVEMENT_MODE not in IMPROVEMENT_MODES:
+    print(f"Unknown RESPONSE_IMPROVEMENT_MODE '{IMPROVEMENT_MODE}', using 'full'")
+    IMPROVEMENT_MODE = "full"
 
-# Initialize OpenAI model - using GPT-3.5-turbo for better performance/cost ratio
-llm = ChatOpenAI(
-    model_name="gpt-3.5-turbo",
-    temperature=0.7,
-    max_tokens=300,
-    api_key=openai_api_key
-)
-
-# Initialize embeddings
-embeddings = OpenAIEmbeddings(api_key=openai_api_key)
+# Seconds to wait for an improved response before returning the original (0 disables)
+IMPROVEMENT_BUDGET = float(os.getenv("RESPONSE_IMPROVEMENT_BUDGET", "5"))
 
 # Prompt template for response improvement
 IMPROVEMENT_PROMPT = PromptTemplate(
@@ -48,105 +49,208 @@ IMPROVEMENT_PROMPT = PromptTemplate(
     """
 )
 
-def load_feedback_data(app: str) -> list:
-    """Load and parse feedback data for a specific app"""
-    feedback_file = f'feedback/{app}_feedback.csv'
-    if not os.path.exists(feedback_file):
-        return []
+# Prompt template for fused mode: answers from the retrieved context in the improved style
+FUSED_QA_PROMPT = PromptTemplate(
+    input_variables=["context", "question", "feedback_data"],
+    template="""
+    You are a customer support assistant for an e-commerce platform.
+    Use the following pieces of context to answer the question at the end.
+    If you don't know the answer, just say that you don't know, don't try to make up an answer.
     
-    feedback_responses = []
-    try:
-        with open(feedback_file, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                feedback_responses.append({
-                    'query': row['query'],
-                    'response': row['response'],
-                    'rating': row['rating']
-                })
-    except Exception as e:
-        print(f"Error loading feedback data: {e}")
+    {context}
     
-    return feedback_responses
+    Previous feedback and successful responses:
+    {feedback_data}
+    
+    Your answer should:
+    1. Be accurate and relevant to the context
+    2. Use a consistent, professional tone
+    3. Include all necessary information
+    4. Be concise yet complete
+    5. Follow the patterns of highly-rated responses
+    
+    Question: {question}
+    Answer:
+    """
+)
+
+# Stored improved responses by app and (normalized query, original response hash), loaded on first use
+_improved_cache = {}
+_improved_cache_lock = threading.Lock()
+
+def format_feedback_examples(app: str, query: str = None) -> str:
+    """Format the thumbs-up feedback most similar to the query (or the most recent) as prompt examples"""
+    return "\n".join([
+        f"Query: {f['query']}\n"
+        f"Successful Response: {f['response']}\n"
+        f"Rating: {f['rating']}\n"
+        for f in get_feedback_index(app).examples(query)
+    ])
+
+def get_fused_prompt(app: str) -> PromptTemplate:
+    """RetrievalQA prompt that answers in the improved style (fused mode)"""
+    return FUSED_QA_PROMPT.partial(feedback_data=format_feedback_examples(app))
+
+def normalize_query(query: str) -> str:
+    """Normalize a query for exact-match lookups"""
+    return re.sub(r'\s+', ' ', re.sub(r'[^\w\s]', ' ', query.lower())).strip()
+
+def training_file(app: str) -> str:
+    return f'training_data/{app}_training.jsonl'
+
+def improved_responses_file(app: str) -> str:
+    return f'training_data/{app}_improved_responses.jsonl'
+
+def response_hash(response: str) -> str:
+    """Hash of an original response, so an improvement is only reused for the answer it rewrote"""
+    return hashlib.sha256(response.strip().encode("utf-8")).hexdigest()
+
+def _load_improved_responses(app: str) -> dict:
+    """Map of (normalized query, original response hash) to the latest stored improved response for an app"""
+    with _improved_cache_lock:
+        if app in _improved_cache:
+            return _improved_cache[app]
+
+        responses = {}
+        try:
+            # Rotated and compressed segments first, then the active file
+            for entry in read_log(improved_responses_file(app)):
+                # Entries saved without the original's hash cannot be matched to an answer
+                if 'original_sha256' in entry:
+                    key = (normalize_query(entry['query']), entry['original_sha256'])
+                    responses[key] = entry['improved_response']
+        except Exception as e:
+            print(f"Error loading improved responses: {e}")
+        _improved_cache[app] = responses
+        return responses
+
+def get_cached_improvement(app: str, query: str, original_response: str):
+    """Return a stored improved response for the same query and original response, or None"""
+    return _load_improved_responses(app).get((normalize_query(query), response_hash(original_response)))
+
+def clear_improved_responses(app: str):
+    """Forget the loaded improved responses of an app, e.g. after its documents changed"""
+    with _improved_cache_lock:
+        _improved_cache.pop(app, None)
+
+async def _stream_improvement(chain, inputs: dict, on_token):
+    """Streams the improved response to `on_token`; the budget applies to the first token.
+
+    Returns the merged message, or None if nothing was generated.
+    """
+    chunks = chain.astream(inputs).__aiter__()
+    try:
+        try:
+            if IMPROVEMENT_BUDGET > 0:
+                message = await asyncio.wait_for(chunks.__anext__(), timeout=IMPROVEMENT_BUDGET)
+            else:
+                message = await chunks.__anext__()
+        except StopAsyncIteration:
+            return None
+
+        on_token(message.content)
+        async for chunk in chunks:
+            if chunk.content:
+                on_token(chunk.content)
+            message = message + chunk
+        return message
+    finally:
+        # Closes the HTTP stream, and frees its gateway slot, also on timeout or cancellation
+        await chunks.aclose()
+
+def _record_usage(app: str, message):
+    usage = getattr(message, "usage_metadata", None) or {}
+    model = (getattr(message, "response_metadata", None) or {}).get("model_name", CHAT_MODEL)
+    record_tokens(app, model, usage.get("input_tokens", 0), usage.get("output_tokens", 0))
+
+async def improve_response(app: str, query: str, original_response: str, on_token=None) -> str:
+    """Generate an improved response based on feedback data
+
+    If `on_token` is given, the improved response is streamed to it as it is generated.
+    """
+    if IMPROVEMENT_MODE in ("off", "fused"):
+        return original_response
+
+    if IMPROVEMENT_MODE == "cached":
+        cached_response = await run_blocking(get_cached_improvement, app, query, original_response)
+        record_cache_lookup("improved", app, bool(cached_response))
+        if cached_response:
+            return cached_response.strip()
 
-async def improve_response(app: str, query: str, original_response: str) -> str:
-    """Generate an improved response based on feedback data"""
     try:
-        # Load relevant feedback data
-        feedback_data = load_feedback_data(app)
-        
-        # Format feedback data for prompt
-        formatted_feedback = "\n".join([
-            f"Query: {f['query']}\n"
-            f"Successful Response: {f['response']}\n"
-            f"Rating: {f['rating']}\n"
-            for f in feedback_data[-5:]  # Use last 5 successful responses
-        ])
-        
         # Create improvement chain using LCEL syntax
-        chain = IMPROVEMENT_PROMPT | llm
+        chain = IMPROVEMENT_PROMPT | get_chat_llm()
         
-        # Generate improved response
-        result = await chain.ainvoke({
+        inputs = {
             "query": query,
             "original_response": original_response,
-            "feedback_data": formatted_feedback
-        })
+            "feedback_data": await run_blocking(format_feedback_examples, app, query)
+        }
+
+        # Generate improved response within the latency budget
+        with timed(app, "improve"):
+            if on_token is not None:
+                result = await _stream_improvement(chain, inputs, on_token)
+            else:
+                pending = chain.ainvoke(inputs)
+                if IMPROVEMENT_BUDGET > 0:
+                    result = await asyncio.wait_for(pending, timeout=IMPROVEMENT_BUDGET)
+                else:
+                    result = await pending
+        if result is None or not result.content.strip():
+            return original_response
+        _record_usage(app, result)
+        improved = result.content
         
-        # Save the improved response for future learning
-        save_improved_response(app, query, result.content)
+        # Save the improved response for future learning (queued, written in the background)
+        try:
+            save_improved_response(app, query, improved, original_response)
+        except RecordQueueFull as e:
+            print(f"Not saving the improved response: {str(e)}")
         
-        return result.content.strip()
+        return improved.strip()
         
+    except asyncio.TimeoutError:
+        print(f"Improving response exceeded {IMPROVEMENT_BUDGET}s budget, returning original")
+        return original_response
     except Exception as e:
         print(f"Error improving response: {e}")
         return original_response  # Fallback to original response if improvement fails
 
-def save_improved_response(app: str, query: str, response: str):
+def save_improved_response(app: str, query: str, response: str, original_response: str):
     """Save improved responses for future training"""
-    improved_file = f'training_data/{app}_improved_responses.jsonl'
-    os.makedirs('training_data', exist_ok=True)
-    
     entry = {
         "timestamp": datetime.now().isoformat(),
         "query": query,
+        "original_sha256": response_hash(original_response),
         "improved_response": response
     }
-    
-    with open(improved_file, 'a', encoding='utf-8') as f:
-        f.write(json.dumps(entry) + '\n')
+    append_entry(improved_responses_file(app), entry)
+
+    # Keep the in-memory lookup used by cached mode current
+    with _improved_cache_lock:
+        if app in _improved_cache:
+            _improved_cache[app][(normalize_query(query), entry["original_sha256"])] = response
 
 def update_training_data(app: str, query: str, response: str):
     """Update training data with new successful interactions"""
-    training_file = f'training_data/{app}_training.jsonl'
-    os.makedirs('training_data', exist_ok=True)
-    
     entry = {
         "timestamp": datetime.now().isoformat(),
         "query": query,
         "response": response
     }
-    
-    with open(training_file, 'a', encoding='utf-8') as f:
-        f.write(json.dumps(entry) + '\n')
-
-def analyze_feedback(app: str):
-    """Analyze feedback data to identify patterns in successful responses"""
-    feedback_data = load_feedback_data(app)
-    if not feedback_data:
-        print(f"No feedback data found for {app}")
-        return
-    
-    positive_feedback = [f for f in feedback_data if f['rating'] == '👍']
-    negative_feedback = [f for f in feedback_data if f['rating'] == '👎']
-    
-    print(f"Analysis for {app}:")
-    print(f"Total feedback entries: {len(feedback_data)}")
-    print(f"Positive feedback: {len(positive_feedback)}")
-    print(f"Negative feedback: {len(negative_feedback)}")
+    append_entry(training_file(app), entry)
+
+def analyze_feedback(app: str) -> dict:
+    """Analyze feedback data: approval rates over time and clusters of negatively rated queries"""
+    from scripts.feedback_analytics import feedback_report, print_report, write_report
+    report = feedback_report(app)
+    print_report(report)
+    if report["total"]:
+        write_report(app, report)
+    return report
 
 if __name__ == "__main__":
     apps = ['sabi', 'trace', 'katsu']
     for app in apps:
         analyze_feedback(app)
-        update_training_data(app) 
\ No newline at end of file
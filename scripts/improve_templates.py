@@ -0,0 +1,71 @@
+# scripts/improve_templates.py
+#
+# Rewrites the Sabi reply templates in the improved style once, offline, so
+# template replies get the same polish as generated answers without an LLM
+# call per request. Rewrites that change the {placeholders} are discarded.
+# Run from the project root: python -m scripts.improve_templates [--output PATH]
+
+import os
+import sys
+import json
+import argparse
+from langchain.prompts import PromptTemplate
+from services.model_clients import get_chat_llm
+from services.sabi_service import RESPONSE_TEMPLATES, SABI_TEMPLATES_PATH, template_fields
+from scripts.improve_responses import format_feedback_examples
+
+TEMPLATE_PROMPT = PromptTemplate(
+    input_variables=["template", "feedback_data"],
+    template="""
+    You are improving the fixed replies of a chatbot for an e-commerce platform.
+
+    Original reply: {template}
+
+    Previous feedback and successful responses:
+    {feedback_data}
+
+    Rewrite the reply so that it:
+    1. Keeps its meaning and every instruction or example it gives
+    2. Uses a consistent, professional tone
+    3. Is concise yet complete
+    4. Keeps every placeholder in curly braces, such as {{order_number}}, exactly as written, and adds none
+
+    Improved reply:
+    """
+)
+
+
+def improve_templates() -> dict:
+    """Returns the improved template of every reply whose rewrite keeps its placeholders."""
+    chain = TEMPLATE_PROMPT | get_chat_llm()
+    feedback_data = format_feedback_examples("sabi")
+    improved = {}
+    for key, template in RESPONSE_TEMPLATES.items():
+        try:
+            text = chain.invoke({"template": template, "feedback_data": feedback_data}).content.strip()
+            if text and template_fields(text) == template_fields(template):
+                improved[key] = text
+            else:
+                print(f"Keeping the original {key} template: the rewrite changed its placeholders")
+        except Exception as e:
+            print(f"Error improving the {key} template: {str(e)}")
+    return improved
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-improve the Sabi reply templates")
+    parser.add_argument("--output", default=SABI_TEMPLATES_PATH)
+    args = parser.parse_args(argv)
+
+    improved = improve_templates()
+    directory = os.path.dirname(args.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(improved, f, ensure_ascii=False, indent=2)
+    print(f"Saved {len(improved)} of {len(RESPONSE_TEMPLATES)} templates to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
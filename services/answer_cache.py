@@ -0,0 +1,125 @@
+# services/answer_cache.py
+
+import os
+import threading
+import numpy as np
+from collections import OrderedDict
+
+# A cached answer is reused when a new query's embedding is at least this similar
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+
+
+class AnswerCache:
+    """Semantic cache of RetrievalQA answers for one app.
+
+    Each entry keeps the normalised query embedding, the answer and the ids of
+    the chunks it was generated from, so entries can be dropped when those
+    chunks change. Entries can also be found by an exact query key, which is
+    how queries answered without embedding them are cached.
+    """
+
+    def __init__(self, threshold: float = ANSWER_CACHE_THRESHOLD, max_entries: int = ANSWER_CACHE_SIZE):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._vectors = []
+        self._entries = []
+        self._matrix = None
+        self._exact = OrderedDict()  # query key -> entry
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalise(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, query_vector=None, key: str = None):
+        """Returns the cached answer for the query key, else for the most similar query above the threshold, or None."""
+        query = self._normalise(query_vector) if query_vector is not None else None
+        with self._lock:
+            entry = self._exact.get(key) if key is not None else None
+            if entry is not None:
+                self._exact.move_to_end(key)
+                self.hits += 1
+                return entry["answer"]
+            if query is not None and self._entries:
+                if self._matrix is None:
+                    self._matrix = np.vstack(self._vectors)
+                scores = self._matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self.hits += 1
+                    return self._entries[best]["answer"]
+            self.misses += 1
+        return None
+
+    def store(self, query_vector, answer: str, source_ids: list, key: str = None):
+        """Caches an answer together with the chunk ids it was generated from, by embedding and/or query key."""
+        entry = {"answer": answer, "sources": set(source_ids)}
+        with self._lock:
+            if key is not None:
+                self._exact[key] = entry
+                self._exact.move_to_end(key)
+                if len(self._exact) > self.max_entries:
+                    self._exact.popitem(last=False)
+            if query_vector is not None:
+                self._vectors.append(self._normalise(query_vector))
+                self._entries.append(entry)
+                if len(self._entries) > self.max_entries:
+                    # Oldest entries are evicted first
+                    del self._vectors[0]
+                    del self._entries[0]
+                self._matrix = None
+
+    def invalidate_sources(self, source_ids) -> int:
+        """Drops every entry that used one of the given chunks. Returns the number removed."""
+        source_ids = set(source_ids)
+        with self._lock:
+            stale = {id(entry) for entry in (*self._entries, *self._exact.values()) if entry["sources"] & source_ids}
+            if stale:
+                keep = [i for i, entry in enumerate(self._entries) if id(entry) not in stale]
+                self._vectors = [self._vectors[i] for i in keep]
+                self._entries = [self._entries[i] for i in keep]
+                self._matrix = None
+                for key in [key for key, entry in self._exact.items() if id(entry) in stale]:
+                    del self._exact[key]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._vectors, self._entries, self._matrix = [], [], None
+            self._exact.clear()
+
+    def stats(self) -> dict:
+        """Returns cache size and hit/miss counters."""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "exact_entries": len(self._exact),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+
+# One cache per app
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_answer_cache(app: str) -> AnswerCache:
+    """Returns the answer cache for an app."""
+    with _caches_lock:
+        if app not in _caches:
+            _caches[app] = AnswerCache()
+        return _caches[app]
+
+
+def invalidate_sources(app: str, source_ids) -> int:
+    """Drops cached answers for an app that were built from the given chunks."""
+    if not source_ids:
+        return 0
+    return get_answer_cache(app).invalidate_sources(source_ids)
@@ -0,0 +1,176 @@
+# services/chunking.py
+#
+# Splits documents into chunks for the indexes. Chunks end on Q&A pair
+# boundaries (or paragraphs, for documents without questions) and are packed
+# up to a token budget; only a pair longer than the budget is cut, first
+# between sentences and then between words. Every chunk keeps the character
+# offsets of its text in the source document.
+
+import os
+import re
+from typing import NamedTuple
+
+# Token budget of a chunk, and tokens repeated between the pieces of a cut pair
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "256"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+# "tiktoken" counts tokens with the model's tokenizer and falls back to an
+# estimate if it cannot be loaded (it is downloaded on first use); "estimate"
+# never tries
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER", "tiktoken").lower()
+
+# Bumped whenever the chunk boundaries change, so saved indexes are rebuilt
+CHUNKER_VERSION = 1
+
+# A line starting with "Q:" / "Question 3." or ending with a question mark starts a pair
+QUESTION_PATTERN = re.compile(r"^[ \t]*(?:q(?:uestion)?[ \t]*\d*[ \t]*[:.)]|.*\?[ \t*]*$)", re.IGNORECASE | re.MULTILINE)
+PARAGRAPH_PATTERN = re.compile(r"\n[ \t]*\n")
+SENTENCE_PATTERN = re.compile(r"[^\n.!?]*(?:[.!?]+|\n|$)")
+WORD_PATTERN = re.compile(r"\S+")
+# Estimate: one token per punctuation mark and per 8 characters of a word
+ESTIMATE_PATTERN = re.compile(r"\w{1,8}|[^\w\s]")
+
+
+class Chunk(NamedTuple):
+    text: str
+    start: int  # character offsets of the text in the document
+    end: int
+    tokens: int
+
+
+_encoding = None
+_tokenizer_name = None
+
+
+def _load_tokenizer():
+    global _encoding, _tokenizer_name
+    if _tokenizer_name is not None:
+        return
+    if CHUNK_TOKENIZER == "tiktoken":
+        try:
+            import tiktoken
+            from services.model_clients import QA_MODEL
+            try:
+                _encoding = tiktoken.encoding_for_model(QA_MODEL)
+            except KeyError:
+                _encoding = tiktoken.get_encoding("cl100k_base")
+            _tokenizer_name = f"tiktoken:{_encoding.name}"
+            return
+        except Exception as e:
+            print(f"Error loading tiktoken, estimating token counts: {str(e)}")
+    _tokenizer_name = "estimate"
+
+
+def tokenizer_name() -> str:
+    """Returns the tokenizer token counts come from ("tiktoken:<encoding>" or "estimate").
+
+    Saved indexes record this name, so chunks counted with a fallback
+    tokenizer are rebuilt once the configured one loads.
+    """
+    _load_tokenizer()
+    return _tokenizer_name
+
+
+def count_tokens(text: str) -> int:
+    """Returns the number of tokens in a text."""
+    _load_tokenizer()
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(ESTIMATE_PATTERN.findall(text))
+
+
+def _strip(text: str, start: int, end: int):
+    """Shrinks a span to exclude surrounding whitespace; returns None if it is blank."""
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return (start, end) if start < end else None
+
+
+def _segments(text: str) -> list:
+    """Returns the (start, end) spans of the Q&A pairs, or paragraphs, of a document."""
+    boundaries = [match.start() for match in QUESTION_PATTERN.finditer(text)]
+    if not boundaries:
+        boundaries = [match.end() for match in PARAGRAPH_PATTERN.finditer(text)]
+    edges = [0] + boundaries + [len(text)]
+    spans = (_strip(text, start, end) for start, end in zip(edges, edges[1:]))
+    return [span for span in spans if span]
+
+
+def _pieces(text: str, start: int, end: int, pattern) -> list:
+    spans = (_strip(text, start + match.start(), start + match.end())
+             for match in pattern.finditer(text[start:end]))
+    return [span for span in spans if span]
+
+
+def _pack(text: str, units: list, max_tokens: int, overlap_tokens: int) -> list:
+    """Groups consecutive (start, end, tokens) units into chunks of at most max_tokens.
+
+    Each new chunk repeats trailing units of the previous one worth up to
+    overlap_tokens.
+    """
+    chunks = []
+    current = []
+    total = 0
+    for unit in units:
+        if current and total + unit[2] > max_tokens:
+            chunks.append(Chunk(text[current[0][0]:current[-1][1]], current[0][0], current[-1][1], total))
+            carried = []
+            carried_tokens = 0
+            for previous in reversed(current):
+                if carried_tokens + previous[2] > overlap_tokens or carried_tokens + previous[2] + unit[2] > max_tokens:
+                    break
+                carried.insert(0, previous)
+                carried_tokens += previous[2]
+            current, total = carried, carried_tokens
+        current.append(unit)
+        total += unit[2]
+    if current:
+        chunks.append(Chunk(text[current[0][0]:current[-1][1]], current[0][0], current[-1][1], total))
+    return chunks
+
+
+def _split_long(text: str, start: int, end: int, max_tokens: int, overlap_tokens: int) -> list:
+    """Cuts a span over the budget between sentences, and sentences over it between words."""
+    units = []
+    for sentence_start, sentence_end in _pieces(text, start, end, SENTENCE_PATTERN):
+        tokens = count_tokens(text[sentence_start:sentence_end])
+        if tokens <= max_tokens:
+            units.append((sentence_start, sentence_end, tokens))
+            continue
+        for word_start, word_end in _pieces(text, sentence_start, sentence_end, WORD_PATTERN):
+            # A single word over the budget is kept whole rather than cut mid-word
+            units.append((word_start, word_end, count_tokens(text[word_start:word_end])))
+    return _pack(text, units, max_tokens, overlap_tokens)
+
+
+def chunk_document(text: str, max_tokens: int = CHUNK_MAX_TOKENS,
+                   overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> list:
+    """Splits a document into Chunks of at most max_tokens that never split a Q&A pair needlessly.
+
+    Whole pairs are packed together up to the budget without overlap; a pair
+    over the budget is cut on its own, with overlap_tokens repeated between
+    its pieces.
+    """
+    units = []
+    chunks = []
+    for start, end in _segments(text):
+        tokens = count_tokens(text[start:end])
+        if tokens <= max_tokens:
+            units.append((start, end, tokens))
+            continue
+        chunks.extend(_pack(text, units, max_tokens, 0))
+        units = []
+        chunks.extend(_split_long(text, start, end, max_tokens, overlap_tokens))
+    chunks.extend(_pack(text, units, max_tokens, 0))
+    return chunks
+
+
+def chunker_settings() -> dict:
+    """Settings that change the chunks produced for the same document."""
+    return {
+        "chunker_version": CHUNKER_VERSION,
+        "chunk_max_tokens": CHUNK_MAX_TOKENS,
+        "chunk_overlap_tokens": CHUNK_OVERLAP_TOKENS,
+        "tokenizer": tokenizer_name()
+    }
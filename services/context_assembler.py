@@ -0,0 +1,217 @@
+# services/context_assembler.py
+#
+# Chooses the chunks stuffed into a RetrievalQA prompt. Candidates come from a
+# BM25 index over the chunks when it matches the query with high confidence
+# (no query embedding is needed), and otherwise from the vector search fused
+# with the BM25 ranking. They are optionally reordered by maximal marginal
+# relevance, chunks overlapping one already chosen from the same document are
+# merged into it, and chunks are added until the app's context token budget
+# is reached.
+
+import os
+import numpy as np
+from typing import Any, List
+from pydantic import PrivateAttr
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from services.chunking import count_tokens
+from services.executor import run_blocking
+from services.lexical_index import LexicalIndex
+from services.metrics import record_context_tokens, record_retrieval
+
+# Tokens of context per prompt; override per app with CONTEXT_TOKEN_BUDGET_<APP>
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+# Most chunks put into a prompt, and candidates fetched to choose them from
+CONTEXT_MAX_CHUNKS = int(os.getenv("CONTEXT_MAX_CHUNKS", "4"))
+CONTEXT_FETCH_K = int(os.getenv("CONTEXT_FETCH_K", "12"))
+# Reorder candidates by maximal marginal relevance ("1" enables); lower lambda favours diversity
+CONTEXT_MMR = os.getenv("CONTEXT_MMR", "0") == "1"
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.5"))
+# Fuse BM25 matches into the vector search ("0" disables the lexical index)
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "1") == "1"
+# A BM25 match is used without embedding the query when the best chunk holds this
+# share of the query's (idf-weighted) words and outscores the next one by this factor
+HYBRID_LEXICAL_COVERAGE = float(os.getenv("HYBRID_LEXICAL_COVERAGE", "1.0"))
+HYBRID_LEXICAL_MARGIN = float(os.getenv("HYBRID_LEXICAL_MARGIN", "1.25"))
+# Reciprocal rank fusion constant; higher values flatten the weight of top ranks
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+# Skip chunks matching only the query's commonest words in BM25 ("1" enables): faster,
+# but the runner-up the margin is checked against may be missed
+HYBRID_LEXICAL_PRUNE = os.getenv("HYBRID_LEXICAL_PRUNE", "0") == "1"
+
+
+def context_budget(app: str) -> int:
+    """Returns the context token budget of an app."""
+    return int(os.getenv(f"CONTEXT_TOKEN_BUDGET_{app.upper()}", CONTEXT_TOKEN_BUDGET))
+
+
+def _tokens(document: Document) -> int:
+    tokens = document.metadata.get("tokens")
+    return tokens if tokens is not None else count_tokens(document.page_content)
+
+
+def _merge(chosen: Document, candidate: Document) -> bool:
+    """Merges a candidate into a chosen chunk it overlaps in the same document.
+
+    Returns True if the candidate was a duplicate or was merged.
+    """
+    if chosen.page_content == candidate.page_content:
+        return True
+    first, second = chosen.metadata, candidate.metadata
+    if first.get("source") != second.get("source") or None in (
+        first.get("start"), first.get("end"), second.get("start"), second.get("end")
+    ):
+        return False
+    if second["start"] >= first["end"] or first["start"] >= second["end"]:
+        return False
+
+    if second["start"] >= first["start"] and second["end"] <= first["end"]:
+        return True
+    if first["start"] >= second["start"] and first["end"] <= second["end"]:
+        text = candidate.page_content
+    elif second["start"] > first["start"]:
+        text = chosen.page_content + candidate.page_content[first["end"] - second["start"]:]
+    else:
+        text = candidate.page_content + chosen.page_content[second["end"] - first["start"]:]
+    chosen.page_content = text
+    chosen.metadata = {
+        **first,
+        "start": min(first["start"], second["start"]),
+        "end": max(first["end"], second["end"]),
+        "tokens": count_tokens(text)
+    }
+    return True
+
+
+def assemble_context(candidates: List[Document], budget: int, max_chunks: int = CONTEXT_MAX_CHUNKS) -> List[Document]:
+    """Returns the candidates, in order, that fit the token budget after merging overlaps."""
+    chosen = []
+    total = 0
+    for candidate in candidates:
+        candidate = Document(page_content=candidate.page_content, metadata=dict(candidate.metadata))
+        merged = False
+        for i, document in enumerate(chosen):
+            before = _tokens(document)
+            trial = Document(page_content=document.page_content, metadata=dict(document.metadata))
+            if _merge(trial, candidate):
+                merged = True
+                added = _tokens(trial) - before
+                if total + added <= budget:
+                    chosen[i] = trial
+                    total += added
+                break
+        if merged or len(chosen) >= max_chunks:
+            continue
+
+        tokens = _tokens(candidate)
+        # A chunk that does not fit may still leave room for a shorter one
+        if total + tokens <= budget:
+            chosen.append(candidate)
+            total += tokens
+    return chosen
+
+
+def build_lexical_index(vectorstore) -> LexicalIndex:
+    """Returns a BM25 index over the chunks of a vector store; payloads are the vector rows."""
+    index = LexicalIndex()
+    for row in range(len(vectorstore.index_to_docstore_id)):
+        document = vectorstore.docstore.search(vectorstore.index_to_docstore_id[row])
+        if isinstance(document, Document):
+            index.add(document.page_content, row)
+    return index
+
+
+def fuse_rankings(*rankings, k: int = HYBRID_RRF_K) -> list:
+    """Merges ranked lists of rows by reciprocal rank fusion, best first."""
+    scores = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            scores[row] = scores.get(row, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class ContextRetriever(BaseRetriever):
+    """Retriever for the QA chains that assembles a deduplicated, token-budgeted context."""
+
+    vectorstore: Any
+    app: str
+    budget: int
+    max_chunks: int = CONTEXT_MAX_CHUNKS
+    fetch_k: int = CONTEXT_FETCH_K
+    mmr: bool = CONTEXT_MMR
+    mmr_lambda: float = CONTEXT_MMR_LAMBDA
+    lexical: Any = None
+    # The last query's BM25 matches: each QA chain gets its own retriever, so the
+    # lexical_match() answer_query runs is reused when the chain retrieves
+    _matched: tuple = PrivateAttr(default=None)
+
+    def _lexical_matches(self, query: str) -> list:
+        if self.lexical is None:
+            return []
+        if self._matched is None or self._matched[0] != query:
+            self._matched = (query, self.lexical.match(query, self.fetch_k, prune=HYBRID_LEXICAL_PRUNE))
+        return self._matched[1]
+
+    @staticmethod
+    def _confident_rows(matches: list):
+        """Returns the rows of BM25 matches good enough to skip the vector search, or None."""
+        if not matches:
+            return None
+        score, coverage, _ = matches[0]
+        if coverage < HYBRID_LEXICAL_COVERAGE:
+            return None
+        if len(matches) > 1 and score < matches[1][0] * HYBRID_LEXICAL_MARGIN:
+            return None
+        return [row for _, _, row in matches]
+
+    def lexical_match(self, query: str):
+        """Returns the rows retrieval will use for a query without embedding it, or None if it needs the vector search."""
+        return self._confident_rows(self._lexical_matches(query))
+
+    def _vector_rows(self, query_vector, matches: list) -> list:
+        _, rows = self.vectorstore.index.search(np.asarray([query_vector], dtype=np.float32), self.fetch_k)
+        rows = [int(row) for row in rows[0] if row >= 0]
+        if not matches:
+            return rows
+        return fuse_rankings(rows, [row for _, _, row in matches])[:self.fetch_k]
+
+    def _candidates(self, rows: list, query_vector=None) -> List[Document]:
+        if self.mmr and query_vector is not None and len(rows) > 1:
+            from langchain_community.vectorstores.utils import maximal_marginal_relevance
+            vectors = [self.vectorstore.index.reconstruct(row) for row in rows]
+            query = np.asarray(query_vector, dtype=np.float32)
+            order = maximal_marginal_relevance(query, vectors, lambda_mult=self.mmr_lambda, k=len(rows))
+            rows = [rows[i] for i in order]
+
+        documents = []
+        for row in rows:
+            document = self.vectorstore.docstore.search(self.vectorstore.index_to_docstore_id[row])
+            if isinstance(document, Document):
+                documents.append(document)
+        return documents
+
+    def _assemble(self, rows: list, query_vector=None) -> List[Document]:
+        documents = assemble_context(self._candidates(rows, query_vector), self.budget, self.max_chunks)
+        record_context_tokens(self.app, sum(_tokens(document) for document in documents))
+        return documents
+
+    def _search(self, query_vector, matches: list) -> List[Document]:
+        record_retrieval(self.app, "hybrid" if matches else "vector")
+        return self._assemble(self._vector_rows(query_vector, matches), query_vector)
+
+    def _get_relevant_documents(self, query: str, *, run_manager) -> List[Document]:
+        matches = self._lexical_matches(query)
+        rows = self._confident_rows(matches)
+        if rows is not None:
+            record_retrieval(self.app, "lexical")
+            return self._assemble(rows)
+        return self._search(self.vectorstore.embeddings.embed_query(query), matches)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager) -> List[Document]:
+        matches = self._lexical_matches(query)
+        rows = self._confident_rows(matches)
+        if rows is not None:
+            record_retrieval(self.app, "lexical")
+            return await run_blocking(self._assemble, rows)
+        query_vector = await self.vectorstore.embeddings.aembed_query(query)
+        return await run_blocking(self._search, query_vector, matches)
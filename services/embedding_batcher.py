@@ -0,0 +1,81 @@
+# services/embedding_batcher.py
+
+import os
+import asyncio
+
+# Query embeddings requested within this many milliseconds share one call (0 disables)
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+
+
+class EmbeddingBatcher:
+    """Collects concurrent query embeddings into one embed_documents-style call.
+
+    The first text queued starts a short window; the batch is sent when the
+    window closes or it reaches the maximum size, and each waiter gets its own
+    vector back. Identical texts in a batch are embedded once.
+    """
+
+    def __init__(self, embed_many, window_ms: float = EMBEDDING_BATCH_WINDOW_MS,
+                 max_batch: int = EMBEDDING_BATCH_SIZE):
+        self.embed_many = embed_many
+        self.window = window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self.batches = 0
+        self.texts = 0
+        self._pending = {}
+        self._timer = None
+        self._loop = None
+        # The event loop only keeps weak references to tasks
+        self._tasks = set()
+
+    async def embed(self, text: str) -> list:
+        """Returns the vector for a text once its batch has been embedded."""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Batches never span event loops
+            self._loop = loop
+            self._pending = {}
+            self._timer = None
+
+        future = self._pending.get(text)
+        if future is None:
+            future = loop.create_future()
+            self._pending[text] = future
+            if len(self._pending) >= self.max_batch:
+                self._send()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.window, self._send)
+        return await asyncio.shield(future)
+
+    def _send(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            self.batches += 1
+            self.texts += len(batch)
+            task = self._loop.create_task(self._embed_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _embed_batch(self, batch: dict):
+        try:
+            vectors = await self.embed_many(list(batch.keys()))
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, vector in zip(batch.values(), vectors):
+            if not future.done():
+                future.set_result(vector)
+
+    def stats(self) -> dict:
+        """Returns how many batches were sent and their average size."""
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "average_batch": self.texts / self.batches if self.batches else 0.0
+        }
@@ -0,0 +1,179 @@
+# services/embedding_cache.py
+
+import os
+import hashlib
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from langchain_core.embeddings import Embeddings
+from services.executor import run_blocking
+from services.embedding_batcher import EmbeddingBatcher, EMBEDDING_BATCH_WINDOW_MS
+from services.metrics import record_cache_lookup
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "cache/embeddings.sqlite3")
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that remembers every vector by a hash of (model, text).
+
+    Lookups go to a bounded in-memory LRU first, then to a SQLite file shared
+    across services and restarts; only texts missing from both are sent to the
+    underlying model. Concurrent async query misses are micro-batched into one
+    call.
+    """
+
+    def __init__(self, underlying: Embeddings, cache_path: str = EMBEDDING_CACHE_PATH,
+                 max_memory_items: int = EMBEDDING_CACHE_SIZE):
+        self.underlying = underlying
+        self.model = getattr(underlying, "model", type(underlying).__name__)
+        self.max_memory_items = max_memory_items
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        # The in-memory LRU and the SQLite connection have separate locks, so memory
+        # hits on the event loop never wait for disk I/O
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._batcher = None
+        if EMBEDDING_BATCH_WINDOW_MS > 0:
+            self._batcher = EmbeddingBatcher(underlying.aembed_documents)
+
+        directory = os.path.dirname(cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(cache_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._db.commit()
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model}\0{text}".encode('utf-8')).hexdigest()
+
+    def _remember(self, key: str, vector: list):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _lookup(self, keys: list) -> dict:
+        """Returns {key: vector} for every key found in memory or on disk."""
+        found = {}
+        with self._lock:
+            missing = []
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+                else:
+                    missing.append(key)
+
+        if not missing:
+            return found
+
+        loaded = {}
+        with self._db_lock:
+            # SQLite limits the number of bound parameters per statement
+            for start in range(0, len(missing), 500):
+                batch = missing[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch
+                ).fetchall()
+                for key, blob in rows:
+                    loaded[key] = array('f', blob).tolist()
+        if loaded:
+            with self._lock:
+                for key, vector in loaded.items():
+                    self._remember(key, vector)
+            found.update(loaded)
+        return found
+
+    def _store(self, entries: dict):
+        with self._lock:
+            for key, vector in entries.items():
+                self._remember(key, vector)
+        rows = [(key, array('f', vector).tobytes()) for key, vector in entries.items()]
+        with self._db_lock:
+            self._db.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+            self._db.commit()
+
+    def _split(self, texts: list):
+        """Returns (keys, cached vectors, texts that still need embedding)."""
+        keys = [self._key(text) for text in texts]
+        found = self._lookup(keys)
+
+        pending = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                pending.setdefault(key, text)
+
+        misses = sum(1 for key in keys if key in pending)
+        with self._lock:
+            self.hits += len(keys) - misses
+            self.misses += misses
+        record_cache_lookup("embedding", "shared", True, len(keys) - misses)
+        record_cache_lookup("embedding", "shared", False, misses)
+        return keys, found, pending
+
+    def embed_documents(self, texts: list) -> list:
+        keys, found, pending = self._split(texts)
+        if pending:
+            vectors = self.underlying.embed_documents(list(pending.values()))
+            computed = dict(zip(pending.keys(), vectors))
+            self._store(computed)
+            found.update(computed)
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> list:
+        keys, found, pending = self._split([text])
+        if pending:
+            vector = self.underlying.embed_query(text)
+            self._store({keys[0]: vector})
+            return vector
+        return found[keys[0]]
+
+    async def aembed_documents(self, texts: list) -> list:
+        keys, found, pending = await run_blocking(self._split, texts)
+        if pending:
+            vectors = await self.underlying.aembed_documents(list(pending.values()))
+            computed = dict(zip(pending.keys(), vectors))
+            await run_blocking(self._store, computed)
+            found.update(computed)
+        return [found[key] for key in keys]
+
+    async def aembed_query(self, text: str) -> list:
+        # Memory hits need no disk access, so they skip the executor
+        key = self._key(text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+        if vector is not None:
+            record_cache_lookup("embedding", "shared", True)
+            return vector
+
+        keys, found, pending = await run_blocking(self._split, [text])
+        if pending:
+            if self._batcher is not None:
+                vector = await self._batcher.embed(text)
+            else:
+                vector = await self.underlying.aembed_query(text)
+            await run_blocking(self._store, {keys[0]: vector})
+            return vector
+        return found[keys[0]]
+
+    def stats(self) -> dict:
+        """Returns cache hit/miss counters."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "memory_items": len(self._memory),
+            "batches": self._batcher.stats() if self._batcher is not None else None
+        }
@@ -0,0 +1,25 @@
+# services/executor.py
+
+import os
+import asyncio
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+# Threads available for blocking work (file IO, index builds) called from request handlers
+BLOCKING_WORKERS = int(os.getenv("BLOCKING_WORKERS", "8"))
+
+_executor = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="blocking")
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Runs a blocking function on the bounded executor without stalling the event loop."""
+    loop = asyncio.get_running_loop()
+    # Carry the request context (e.g. its stage timings) into the worker thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, functools.partial(context.run, func, *args, **kwargs))
+
+
+def shutdown_executor():
+    """Waits for queued blocking work to finish."""
+    _executor.shutdown(wait=True)
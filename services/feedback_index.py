@@ -0,0 +1,95 @@
+# services/feedback_index.py
+
+import os
+import io
+import csv
+import threading
+from collections import deque
+from services.lexical_index import LexicalIndex
+
+# Thumbs-up examples put into the improvement prompts
+FEEDBACK_EXAMPLES = int(os.getenv("FEEDBACK_EXAMPLES", "5"))
+
+POSITIVE = '👍'
+
+
+class FeedbackIndex:
+    """Thumbs-up feedback of one app, searchable by query similarity.
+
+    The feedback CSV is read once, then only the rows appended since the last
+    read (by this or another worker) are indexed, so lookups never re-read the
+    whole file. Repeated queries keep only their latest response.
+    """
+
+    def __init__(self, app: str):
+        self.path = f'feedback/{app}_feedback.csv'
+        self._index = LexicalIndex()
+        self._recent = deque(maxlen=FEEDBACK_EXAMPLES)
+        self._offset = 0
+        self._columns = None
+        self._lock = threading.Lock()
+
+    def _add(self, query: str, response: str):
+        example = {"query": query, "response": response, "rating": POSITIVE}
+        self._index.add(query, example, key=" ".join(query.lower().split()))
+        self._recent.append(example)
+
+    def refresh(self):
+        """Indexes the rows appended to the feedback file since the last refresh."""
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return
+        if size <= self._offset:
+            return
+
+        with self._lock:
+            with open(self.path, 'rb') as f:
+                f.seek(self._offset)
+                data = f.read(size - self._offset)
+            # A row still being written is picked up by the next refresh
+            complete = data.rfind(b"\n") + 1
+            if not complete:
+                return
+            self._offset += complete
+
+            rows = csv.reader(io.StringIO(data[:complete].decode('utf-8', errors='replace'), newline=''))
+            if self._columns is None:
+                header = next(rows, None)
+                if header is None:
+                    return
+                self._columns = {name: i for i, name in enumerate(header)}
+            query_at = self._columns.get('query')
+            response_at = self._columns.get('response')
+            rating_at = self._columns.get('rating')
+            if None in (query_at, response_at, rating_at):
+                return
+            for row in rows:
+                if len(row) > max(query_at, response_at, rating_at) and row[rating_at].strip() == POSITIVE:
+                    self._add(row[query_at], row[response_at])
+
+    def examples(self, query: str = None, k: int = FEEDBACK_EXAMPLES) -> list:
+        """Returns the k thumbs-up examples most similar to the query, or the most recent ones.
+
+        Recent examples also fill up the list when fewer than k are similar.
+        """
+        self.refresh()
+        found = [example for _, example in self._index.search(query, k)] if query else []
+        for example in reversed(self._recent):
+            if len(found) >= k:
+                break
+            if example not in found:
+                found.append(example)
+        return found
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_feedback_index(app: str) -> FeedbackIndex:
+    """Returns the process-wide feedback index of an app."""
+    with _indexes_lock:
+        if app not in _indexes:
+            _indexes[app] = FeedbackIndex(app)
+        return _indexes[app]
@@ -0,0 +1,423 @@
+# services/index_store.py
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from contextlib import contextmanager
+from langchain_community.vectorstores import FAISS
+from services.model_clients import get_embeddings
+from services.answer_cache import get_answer_cache, invalidate_sources
+from services.chunking import chunk_document, chunker_settings
+from services.context_assembler import (
+    ContextRetriever, CONTEXT_MAX_CHUNKS, HYBRID_RETRIEVAL, context_budget, build_lexical_index
+)
+from services.mapped_index import write_version, read_version, open_vectorstore
+from services.metrics import timed
+from scripts.improve_responses import clear_improved_responses
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process file locks
+    fcntl = None
+
+# Document folders for each app
+APP_FOLDERS = {
+    "sabi": "documents/sabiMarket",
+    "trace": "documents/trace",
+    "katsu": "documents/katsu"
+}
+
+# Where the built indexes are saved. Each app folder holds numbered version
+# directories and a CURRENT file naming the live one; publishing a version
+# swaps CURRENT atomically and every worker maps the new files on its next check.
+INDEX_ROOT = os.getenv("INDEX_ROOT", "indexes")
+MANIFEST_FILE = "manifest.json"
+CURRENT_FILE = "CURRENT"
+LOCK_FILE = ".lock"
+# Versions kept on disk, and seconds between checks for a newer one
+INDEX_KEEP_VERSIONS = int(os.getenv("INDEX_KEEP_VERSIONS", "2"))
+INDEX_CHECK_INTERVAL = float(os.getenv("INDEX_CHECK_INTERVAL", "2"))
+
+# Mapped indexes, their manifests and version names, keyed by app
+_indexes = {}
+_lexical_indexes = {}  # app -> (vectorstore, BM25 index over its chunks)
+_manifests = {}
+_versions = {}
+_checked = {}
+_locks = {app: threading.RLock() for app in APP_FOLDERS}
+
+
+def get_index_dir(app: str) -> str:
+    """Returns the folder the index for an app is saved in."""
+    return os.path.join(INDEX_ROOT, app)
+
+
+def hash_file(file_path: str) -> str:
+    """Returns the sha256 hash of a file's content."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(65536), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def scan_documents(app: str) -> dict:
+    """Returns a {filename: sha256} map of the .txt documents for an app."""
+    folder = APP_FOLDERS[app]
+    if not os.path.exists(folder):
+        return {}
+
+    hashes = {}
+    for filename in sorted(os.listdir(folder)):
+        if filename.endswith('.txt'):
+            try:
+                hashes[filename] = hash_file(os.path.join(folder, filename))
+            except Exception as e:
+                print(f"Error hashing {filename}: {str(e)}")
+    return hashes
+
+
+def load_document_chunks(app: str, filename: str):
+    """Reads and chunks one document, returning (texts, metadatas, ids)."""
+    file_path = os.path.join(APP_FOLDERS[app], filename)
+    with timed(app, "document_load"):
+        with open(file_path, 'r', encoding='utf-8') as file:
+            text = file.read()
+    with timed(app, "split"):
+        chunks = chunk_document(text)
+
+    # Offsets locate each chunk in the source document
+    ids = [f"{filename}#{i}" for i in range(len(chunks))]
+    metadatas = [
+        {"source": filename, "id": chunk_id, "start": chunk.start, "end": chunk.end, "tokens": chunk.tokens}
+        for chunk_id, chunk in zip(ids, chunks)
+    ]
+    return [chunk.text for chunk in chunks], metadatas, ids
+
+
+def _settings() -> dict:
+    """Settings that invalidate a saved index when they change."""
+    embeddings = get_embeddings()
+    return {
+        **chunker_settings(),
+        "embedding_model": getattr(embeddings, "model", type(embeddings).__name__)
+    }
+
+
+def _read_current(app: str):
+    """Returns the name of the live version for an app, or None."""
+    try:
+        with open(os.path.join(get_index_dir(app), CURRENT_FILE), 'r', encoding='utf-8') as file:
+            return file.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _read_manifest(app: str, version: str):
+    if version is None:
+        return None
+    manifest_path = os.path.join(get_index_dir(app), version, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except Exception as e:
+        print(f"Error reading index manifest for {app}: {str(e)}")
+        return None
+
+
+@contextmanager
+def _writer_lock(app: str):
+    """Serialises index writes for an app across threads and worker processes."""
+    with _locks[app]:
+        index_dir = get_index_dir(app)
+        os.makedirs(index_dir, exist_ok=True)
+        with open(os.path.join(index_dir, LOCK_FILE), 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _publish(app: str, vectorstore, manifest: dict):
+    """Writes an index as a new version, then points CURRENT at it."""
+    index_dir = get_index_dir(app)
+    versions = _list_versions(app)
+    version = f"v{(int(versions[-1][1:]) + 1) if versions else 1:06d}"
+    version_dir = os.path.join(index_dir, version)
+    os.makedirs(version_dir, exist_ok=True)
+
+    if vectorstore is not None:
+        count = vectorstore.index.ntotal
+        records = []
+        for i in range(count):
+            doc = vectorstore.docstore.search(vectorstore.index_to_docstore_id[i])
+            records.append({"id": doc.metadata.get("id"), "text": doc.page_content, "metadata": doc.metadata})
+        with timed(app, "index_publish"):
+            write_version(version_dir, vectorstore.index.reconstruct_n(0, count), records)
+
+    with open(os.path.join(version_dir, MANIFEST_FILE), 'w', encoding='utf-8') as file:
+        json.dump(manifest, file)
+
+    # The version is complete on disk before any worker can see it
+    current_path = os.path.join(index_dir, CURRENT_FILE)
+    tmp_path = current_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        file.write(version)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, current_path)
+
+    # Workers still mapping a removed version keep their pages until they swap
+    for old_version in _list_versions(app)[:-INDEX_KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(index_dir, old_version), ignore_errors=True)
+
+
+def _list_versions(app: str) -> list:
+    index_dir = get_index_dir(app)
+    if not os.path.exists(index_dir):
+        return []
+    return sorted(
+        name for name in os.listdir(index_dir)
+        if name.startswith("v") and name[1:].isdigit() and os.path.isdir(os.path.join(index_dir, name))
+    )
+
+
+def _load_writable(app: str, version: str, manifest: dict):
+    """Loads a version into an in-memory FAISS index that can be changed and republished."""
+    if not manifest["files"]:
+        return None
+    vectors, records = read_version(os.path.join(get_index_dir(app), version))
+    vectorstore = FAISS.from_embeddings(
+        [(record["text"], vector) for record, vector in zip(records, vectors.tolist())],
+        get_embeddings(),
+        metadatas=[record["metadata"] for record in records],
+        ids=[record["id"] for record in records]
+    )
+    return vectorstore
+
+
+def build_index(app: str, required: tuple = ()):
+    """Chunks and embeds every document for an app; a document in `required` that cannot be read raises."""
+    texts, metadatas, ids = [], [], []
+    files = {}
+    for filename, sha256 in scan_documents(app).items():
+        try:
+            chunks, chunk_metadatas, chunk_ids = load_document_chunks(app, filename)
+        except Exception as e:
+            if filename in required:
+                raise
+            print(f"Error reading {filename}: {str(e)}")
+            continue
+        texts.extend(chunks)
+        metadatas.extend(chunk_metadatas)
+        ids.extend(chunk_ids)
+        files[filename] = {"sha256": sha256, "ids": chunk_ids}
+
+    vectorstore = None
+    if texts:
+        with timed(app, "index_build"):
+            vectorstore = FAISS.from_texts(
+                texts=texts,
+                embedding=get_embeddings(),
+                metadatas=metadatas,
+                ids=ids
+            )
+
+    manifest = {"settings": _settings(), "files": files}
+    return vectorstore, manifest
+
+
+def _apply_changes(app: str, vectorstore, manifest: dict, changes: dict, required: tuple = ()):
+    """Applies {filename: sha256 or None (deleted)} changes to an index, embedding only the changed files.
+
+    A replaced file that cannot be read keeps its old chunks (and is retried
+    on the next update), or raises if it is in `required`.
+    """
+    files = manifest["files"]
+    for filename, sha256 in changes.items():
+        if sha256 is not None:
+            try:
+                chunks, metadatas, ids = load_document_chunks(app, filename)
+            except Exception as e:
+                if filename in required:
+                    raise
+                print(f"Error reading {filename}: {str(e)}")
+                continue
+
+        # Remove the chunks of a replaced or deleted file
+        old_ids = files.pop(filename, {}).get("ids", [])
+        if vectorstore is not None and old_ids:
+            live_ids = set(vectorstore.index_to_docstore_id.values())
+            stale_ids = [chunk_id for chunk_id in old_ids if chunk_id in live_ids]
+            if stale_ids:
+                vectorstore.delete(stale_ids)
+
+        if sha256 is None:
+            continue
+
+        if chunks:
+            with timed(app, "index_build"):
+                if vectorstore is None:
+                    vectorstore = FAISS.from_texts(
+                        texts=chunks,
+                        embedding=get_embeddings(),
+                        metadatas=metadatas,
+                        ids=ids
+                    )
+                else:
+                    vectorstore.add_texts(chunks, metadatas=metadatas, ids=ids)
+        files[filename] = {"sha256": sha256, "ids": ids}
+
+    if not files:
+        vectorstore = None
+    return vectorstore, manifest
+
+
+def _diff(manifest: dict, current: dict) -> dict:
+    """Returns the {filename: sha256 or None} changes between a manifest and the documents folder."""
+    saved = {name: entry["sha256"] for name, entry in manifest["files"].items()}
+    changes = {name: sha256 for name, sha256 in current.items() if saved.get(name) != sha256}
+    changes.update({name: None for name in saved if name not in current})
+    return changes
+
+
+def _update_published(app: str, changes_for, required: tuple = ()) -> bool:
+    """Republishes the live version with the changes `changes_for(manifest)` returns. True if it changed.
+
+    Nothing is published if a document in `required` cannot be read.
+    """
+    with _writer_lock(app):
+        version = _read_current(app)
+        manifest = _read_manifest(app, version)
+        if not manifest or manifest.get("settings") != _settings():
+            _publish(app, *build_index(app, required))
+            return True
+
+        changes = changes_for(manifest)
+        if not changes:
+            return False
+        vectorstore = _load_writable(app, version, manifest)
+        _publish(app, *_apply_changes(app, vectorstore, manifest, changes, required))
+        return True
+
+
+def prepare_index(app: str) -> bool:
+    """Builds or incrementally updates the published index so it matches the documents folder.
+
+    Only documents that changed since the live version are re-embedded.
+    Returns True if a new version was published.
+    """
+    return _update_published(app, lambda manifest: _diff(manifest, scan_documents(app)))
+
+
+def _map_current(app: str):
+    """Maps the live version of an app if it differs from the one this worker uses."""
+    version = _read_current(app)
+    if version == _versions.get(app):
+        return
+    manifest = _read_manifest(app, version)
+    if manifest is None:
+        return
+
+    vectorstore = lexical_index = None
+    if manifest["files"]:
+        with timed(app, "index_map"):
+            vectorstore = open_vectorstore(os.path.join(get_index_dir(app), version), get_embeddings())
+        if HYBRID_RETRIEVAL:
+            with timed(app, "lexical_index"):
+                lexical_index = build_lexical_index(vectorstore)
+
+    # Cached answers built from chunks that changed are no longer valid, nor are their improvements
+    old_manifest = _manifests.get(app)
+    if old_manifest is not None:
+        if old_manifest.get("settings") != manifest.get("settings"):
+            get_answer_cache(app).clear()
+            clear_improved_responses(app)
+        else:
+            changed = False
+            for filename, entry in old_manifest["files"].items():
+                if manifest["files"].get(filename, {}).get("sha256") != entry["sha256"]:
+                    invalidate_sources(app, entry["ids"])
+                    changed = True
+            if changed:
+                clear_improved_responses(app)
+
+    _indexes[app], _lexical_indexes[app] = vectorstore, (vectorstore, lexical_index)
+    _manifests[app], _versions[app] = manifest, version
+
+
+def get_vectorstore(app: str):
+    """Returns the mapped index for an app, loading it on first use. None if there are no documents.
+
+    A version published by another worker is picked up within INDEX_CHECK_INTERVAL seconds.
+    """
+    now = time.monotonic()
+    if app not in _versions:
+        with _locks[app]:
+            if app not in _versions:
+                prepare_index(app)
+                _map_current(app)
+                _checked[app] = now
+    elif now - _checked.get(app, 0) >= INDEX_CHECK_INTERVAL:
+        with _locks[app]:
+            _checked[app] = now
+            _map_current(app)
+    return _indexes.get(app)
+
+
+def update_document(app: str, filename: str) -> bool:
+    """Re-indexes a single document after it was added, replaced or deleted. Returns True if the index changed.
+
+    Raises if the document cannot be read; its previous chunks stay live.
+    """
+    file_path = os.path.join(APP_FOLDERS[app], filename)
+    sha256 = hash_file(file_path) if os.path.exists(file_path) else None
+
+    def changes_for(manifest):
+        if manifest["files"].get(filename, {}).get("sha256") == sha256:
+            return {}
+        return {filename: sha256}
+
+    changed = _update_published(app, changes_for, required=(filename,))
+    with _locks[app]:
+        _map_current(app)
+    return changed
+
+
+def get_retriever(app: str, k: int = CONTEXT_MAX_CHUNKS):
+    """Returns a retriever assembling up to k chunks within the app's context budget, or None if there are no documents."""
+    vectorstore = get_vectorstore(app)
+    if vectorstore is None:
+        return None
+    # The lexical index's rows only apply to the vector store it was built from
+    mapped, lexical_index = _lexical_indexes.get(app, (None, None))
+    return ContextRetriever(
+        vectorstore=vectorstore, app=app, budget=context_budget(app), max_chunks=k,
+        lexical=lexical_index if mapped is vectorstore else None
+    )
+
+
+def publish_all_indexes():
+    """Builds or updates the published index of every app without mapping it (run once before starting workers)."""
+    for app in APP_FOLDERS:
+        try:
+            prepare_index(app)
+        except Exception as e:
+            print(f"Error preparing index for {app}: {str(e)}")
+
+
+def load_all_indexes():
+    """Loads (or builds) the index for every app."""
+    for app in APP_FOLDERS:
+        try:
+            get_vectorstore(app)
+        except Exception as e:
+            print(f"Error loading index for {app}: {str(e)}")
@@ -0,0 +1,173 @@
+# services/intent_router.py
+
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+# Intents returned by classify_intent
+RETURN_REQUEST = "return_request"      # order number followed by a reason
+RETURN_PROMPT = "return_prompt"        # asks about returns without details
+RETURN_REASON_PROMPT = "return_reason_prompt"  # order number given after a return prompt, reason missing
+TRACK_ORDER = "track_order"            # tracking request with an order number
+TRACK_PROMPT = "track_prompt"          # tracking request without an order number
+ISSUE_REPORT = "issue_report"
+CALLBACK_REQUEST = "callback_request"  # callback request with a phone number
+CALLBACK_PROMPT = "callback_prompt"    # callback request without a phone number
+PHONE_CALLBACK = "phone_callback"      # bare phone number, no explicit callback request
+NEW_ORDER = "new_order"                # order with item (quantity unit) pairs
+ORDER_PROMPT = "order_prompt"          # order request without parsable items
+QUESTION = "question"                  # anything else goes to the QA chain
+
+# Keyword lists per keyword group, matched as substrings of the lowercased query
+INTENT_KEYWORDS = {
+    "order": ["order", "buy", "purchase", "want", "need", "get"],
+    "track": ["track", "where", "status", "follow"],
+    "return": ["return", "exchange", "refund", "reason"],
+    "issue": ["issue", "problem", "complaint", "wrong"],
+    "callback": ["callback", "call back", "call me", "contact me", "phone"],
+}
+
+ORDER_NUMBER_PATTERN = re.compile(r'[A-Z]{2}\d{8}')
+PHONE_PATTERN = re.compile(r'(?:\d{11})|(?:\d{3}[-\s]?\d{4}[-\s]?\d{4})')
+ITEM_QUANTITY_PATTERN = re.compile(r'([^()]+)\s*\((\d+)\s*(?:pack|packs|can|cans|bottle|bottles)\)')
+ITEM_HINT_PATTERN = re.compile(r'\(\d+\s*(?:pack|packs|can|cans|bottle|bottles)\)')
+
+
+def _trie_pattern(words) -> str:
+    """Builds a prefix-factored alternation (a regex trie) matching any of the words."""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        ends_here = '' in node
+        body = branches[0] if len(branches) == 1 and not ends_here else '(?:' + '|'.join(branches) + ')'
+        return body + ('?' if ends_here else '')
+
+    return build(trie)
+
+
+# Keyword -> group lookup and one combined pattern over every keyword. The
+# lookahead reports a match at every position, so keywords inside other words
+# or overlapping each other are all found in a single scan.
+_KEYWORD_GROUPS = {
+    keyword: group
+    for group, keywords in INTENT_KEYWORDS.items()
+    for keyword in keywords
+}
+_KEYWORD_PATTERN = re.compile("(?=(" + _trie_pattern(_KEYWORD_GROUPS) + "))")
+
+
+@dataclass
+class IntentResult:
+    intent: str
+    order_number: Optional[str] = None
+    phone_number: Optional[str] = None
+    reason: Optional[str] = None
+    items: List[Tuple[str, str]] = field(default_factory=list)
+
+
+@dataclass
+class IntentResponse:
+    """A reply with the intent it answers. Template replies are final and skip the LLM rewrite."""
+    text: str
+    intent: str
+    templated: bool = True
+
+
+def match_keyword_groups(query_lower: str) -> set:
+    """Returns the keyword groups present in a lowercased query."""
+    return {_KEYWORD_GROUPS[match.group(1)] for match in _KEYWORD_PATTERN.finditer(query_lower)}
+
+
+def _phone_number(query: str) -> Optional[str]:
+    phone_match = PHONE_PATTERN.search(query)
+    if phone_match:
+        return ''.join(filter(str.isdigit, phone_match.group()))
+    return None
+
+
+def classify_intent(query: str) -> IntentResult:
+    """Classifies a Sabi query and extracts its entities.
+
+    Intents are resolved in priority order: return request with a reason,
+    return, tracking, issue, callback, bare phone number, order, question.
+    """
+    order_match = ORDER_NUMBER_PATTERN.search(query)
+    order_number = order_match.group() if order_match else None
+
+    # An order number followed by text is a return request whatever the keywords
+    if order_match:
+        reason = query[order_match.end():].strip()
+        if reason:
+            return IntentResult(RETURN_REQUEST, order_number=order_number, reason=reason)
+
+    query_lower = query.lower()
+    groups = match_keyword_groups(query_lower)
+
+    if "return" in groups:
+        return IntentResult(RETURN_PROMPT)
+
+    if "track" in groups:
+        if order_number:
+            return IntentResult(TRACK_ORDER, order_number=order_number)
+        return IntentResult(TRACK_PROMPT)
+
+    if "issue" in groups:
+        return IntentResult(ISSUE_REPORT)
+
+    phone_number = _phone_number(query)
+    if "callback" in groups:
+        if phone_number:
+            return IntentResult(CALLBACK_REQUEST, phone_number=phone_number)
+        return IntentResult(CALLBACK_PROMPT)
+
+    if phone_number:
+        return IntentResult(PHONE_CALLBACK, phone_number=phone_number)
+
+    has_items = ITEM_HINT_PATTERN.search(query_lower) is not None
+    if "order" in groups or has_items:
+        # The item pattern backtracks heavily, so only run it when an item is present
+        items = []
+        if has_items:
+            items = [(item.strip(), qty) for item, qty in ITEM_QUANTITY_PATTERN.findall(query)]
+        if items:
+            return IntentResult(NEW_ORDER, items=items)
+        return IntentResult(ORDER_PROMPT)
+
+    return IntentResult(QUESTION, order_number=order_number)
+
+
+# Intents that ask the customer for details; the next message may complete them
+PROMPT_INTENTS = {RETURN_PROMPT, RETURN_REASON_PROMPT, TRACK_PROMPT, CALLBACK_PROMPT}
+
+
+def resolve_followup(result: IntentResult, query: str, pending: Optional[str],
+                     pending_order_number: Optional[str] = None) -> IntentResult:
+    """Completes the intent of the previous prompt with the details sent in reply.
+
+    `pending` is the prompt intent of the customer's previous turn, e.g. a bare
+    order number after a tracking prompt is a tracking request.
+    """
+    if pending is None:
+        return result
+
+    if pending == TRACK_PROMPT and result.intent == QUESTION and result.order_number:
+        return IntentResult(TRACK_ORDER, order_number=result.order_number)
+
+    if pending == RETURN_PROMPT and result.intent == QUESTION and result.order_number:
+        return IntentResult(RETURN_REASON_PROMPT, order_number=result.order_number)
+
+    if pending == RETURN_REASON_PROMPT and result.intent == QUESTION and pending_order_number:
+        return IntentResult(RETURN_REQUEST, order_number=pending_order_number, reason=query.strip())
+
+    if pending == CALLBACK_PROMPT and result.intent == PHONE_CALLBACK:
+        return IntentResult(CALLBACK_REQUEST, phone_number=result.phone_number)
+
+    return result
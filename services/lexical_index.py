@@ -0,0 +1,127 @@
+# services/lexical_index.py
+
+import re
+import math
+import heapq
+import threading
+from collections import Counter
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+# Words too common to say anything about a query
+STOP_WORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it me my of on or our so "
+    "that the this to was we what when where which who will with you your".split()
+)
+
+
+def tokenize(text: str) -> list:
+    """Lowercase word and number tokens of a text, without stop words."""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS]
+
+
+class LexicalIndex:
+    """In-memory BM25 inverted index that documents can be added to one at a time.
+
+    Each document has a payload returned by searches, and optionally a key:
+    adding a document with a key already present replaces that document.
+    Scores use the collection statistics at query time, so additions never
+    require a rebuild.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings = {}  # token -> {doc: term frequency}
+        self._lengths = []
+        self._tokens = []
+        self._payloads = []
+        self._keys = {}
+        self._live = 0
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._live
+
+    def _remove(self, doc: int):
+        for token in self._tokens[doc]:
+            postings = self._postings[token]
+            del postings[doc]
+            if not postings:
+                del self._postings[token]
+        self._total_length -= self._lengths[doc]
+        self._lengths[doc] = 0
+        self._tokens[doc] = ()
+        self._payloads[doc] = None
+        self._live -= 1
+
+    def add(self, text: str, payload, key=None) -> int:
+        """Indexes a text and returns its document number."""
+        counts = Counter(tokenize(text))
+        with self._lock:
+            if key is not None and key in self._keys:
+                previous = self._keys[key]
+                if self._payloads[previous] is not None:
+                    self._remove(previous)
+            doc = len(self._payloads)
+            for token, count in counts.items():
+                self._postings.setdefault(token, {})[doc] = count
+            length = sum(counts.values())
+            self._lengths.append(length)
+            self._tokens.append(tuple(counts))
+            self._payloads.append(payload)
+            self._total_length += length
+            self._live += 1
+            if key is not None:
+                self._keys[key] = doc
+        return doc
+
+    def _score(self, tokens: set, prune: bool = True):
+        """Returns the BM25 score and the matched idf weight of each candidate, and the query's idf weight.
+
+        Query tokens are scored rarest first. With `prune`, a token with more
+        postings than there are candidates so far only adds to the scores of
+        those candidates, which keeps searches for common words fast; documents
+        matching only such common tokens are then missing from the results, so
+        the scores are exact but the ranking may not be. Tokens that appear in
+        no document weigh as much as the rarest possible token.
+        """
+        average_length = self._total_length / self._live or 1.0
+        matched = sorted(
+            (self._postings[token] for token in tokens if token in self._postings), key=len
+        )
+        unknown = len(tokens) - len(matched)
+        total_weight = unknown * math.log(1 + (self._live + 0.5) / 0.5)
+        scores = {}
+        weights = {}
+        for postings in matched:
+            idf = math.log(1 + (self._live - len(postings) + 0.5) / (len(postings) + 0.5))
+            total_weight += idf
+            if prune and scores and len(postings) > len(scores):
+                pairs = [(doc, postings[doc]) for doc in scores if doc in postings]
+            else:
+                pairs = postings.items()
+            for doc, frequency in pairs:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[doc] / average_length)
+                scores[doc] = scores.get(doc, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+                weights[doc] = weights.get(doc, 0.0) + idf
+        return scores, weights, total_weight
+
+    def search(self, query: str, k: int = 5, min_score: float = 0.0, prune: bool = True) -> list:
+        """Returns up to k (score, payload) pairs, best first, scoring above min_score."""
+        return [(score, payload) for score, _, payload in self.match(query, k, prune) if score > min_score]
+
+    def match(self, query: str, k: int = 5, prune: bool = True) -> list:
+        """Returns up to k (score, coverage, payload) triples, best first.
+
+        Coverage is the idf-weighted share of the query's tokens the document
+        contains: 1.0 means every informative word of the query was found.
+        Pass prune=False to score every document containing a query token.
+        """
+        tokens = set(tokenize(query))
+        with self._lock:
+            if not tokens or not self._live:
+                return []
+            scores, weights, total_weight = self._score(tokens, prune)
+            best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            return [(score, weights[doc] / total_weight, self._payloads[doc]) for doc, score in best]
@@ -0,0 +1,413 @@
+# services/llm_gateway.py
+
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+import httpx
+from collections import deque
+from services.metrics import record_gateway
+
+# In-flight requests allowed per model, shared by its sync and async clients
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+
+# Token bucket per model: sustained requests per second and burst size (0 disables)
+LLM_RATE_LIMIT = float(os.getenv("LLM_RATE_LIMIT", "10"))
+LLM_RATE_BURST = int(os.getenv("LLM_RATE_BURST", "20"))
+
+# Retries for rate-limited, overloaded or failed requests, with full-jitter backoff
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE = float(os.getenv("LLM_RETRY_BASE", "0.5"))
+LLM_RETRY_CAP = float(os.getenv("LLM_RETRY_CAP", "8"))
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+# Identical requests already in flight share one response ("0" disables)
+LLM_COALESCE = os.getenv("LLM_COALESCE", "1") != "0"
+
+
+class TokenBucket:
+    """Thread-safe token bucket; each request takes one token."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Takes a token and returns the seconds to wait before using it."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+class AdmissionSlots:
+    """Concurrency limit shared by threads and event loops, granted in arrival order.
+
+    A released slot is handed directly to the oldest waiter, whether it waits
+    in a thread (sync clients) or on an event loop (async clients).
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self._used = 0
+        self._waiters = deque()  # threading.Event or (loop, future)
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self._used < self.limit and not self._waiters:
+                self._used += 1
+                return
+            granted = threading.Event()
+            self._waiters.append(granted)
+        granted.wait()
+
+    async def acquire_async(self):
+        with self._lock:
+            if self._used < self.limit and not self._waiters:
+                self._used += 1
+                return
+            waiter = (asyncio.get_running_loop(), asyncio.get_running_loop().create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._waiters.remove(waiter)
+                    waiting = True
+                except ValueError:
+                    waiting = False
+            # Granted just before the cancellation: pass the slot on
+            if not waiting and waiter[1].done() and not waiter[1].cancelled():
+                self.release()
+            raise
+
+    def _grant(self, future):
+        # Runs on the waiter's loop; a waiter cancelled meanwhile passes the slot on
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(None)
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self._used -= 1
+                return
+            waiter = self._waiters.popleft()
+        if isinstance(waiter, threading.Event):
+            waiter.set()
+        else:
+            loop, future = waiter
+            try:
+                loop.call_soon_threadsafe(self._grant, future)
+            except RuntimeError:  # the waiter's loop is closed
+                self.release()
+
+
+class ModelGateway:
+    """Admission control shared by every outbound request for one model.
+
+    Requests wait for a rate-limit token and one of the model's concurrency
+    slots (shared by its sync and async clients), are retried with jittered
+    backoff on 429/5xx and connection errors, and identical non-streaming
+    requests already in flight are coalesced into one.
+    """
+
+    def __init__(self, model: str, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 rate: float = LLM_RATE_LIMIT, burst: int = LLM_RATE_BURST,
+                 max_retries: int = LLM_MAX_RETRIES, coalesce: bool = LLM_COALESCE):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.coalesce = coalesce
+        self.bucket = TokenBucket(rate, burst)
+        self.slots = AdmissionSlots(max_concurrency)
+        self.sync_inflight = {}
+        self.async_inflight = {}
+        self.inflight_lock = threading.Lock()
+
+    def throttle_delay(self) -> float:
+        delay = self.bucket.reserve()
+        record_gateway(self.model, "request", delay)
+        return delay
+
+    def retry_delay(self, attempt: int, response: httpx.Response = None) -> float:
+        """Seconds to wait before retry number `attempt`, honouring Retry-After."""
+        record_gateway(self.model, "retry")
+        if response is not None:
+            try:
+                return min(LLM_RETRY_CAP, float(response.headers.get("retry-after", "")))
+            except ValueError:
+                pass
+        return random.uniform(0, min(LLM_RETRY_CAP, LLM_RETRY_BASE * 2 ** attempt))
+
+    def should_retry(self, attempt: int, response: httpx.Response) -> bool:
+        return response.status_code in RETRY_STATUSES and attempt < self.max_retries
+
+    def coalesce_key(self, request: httpx.Request, body: bytes):
+        """Returns the key identical requests share, or None if the request is streamed."""
+        if not self.coalesce or request.method != "POST":
+            return None
+        try:
+            if json.loads(body or b"{}").get("stream"):
+                return None
+        except (ValueError, AttributeError):
+            pass
+        return hashlib.sha256(str(request.url).encode("utf-8") + b"\0" + body).hexdigest()
+
+
+def _buffered(response: httpx.Response, raw: bytes, request: httpx.Request) -> httpx.Response:
+    """Copy of a response for a request, with its undecoded body held in memory."""
+    return httpx.Response(
+        response.status_code,
+        headers=response.headers,
+        content=raw,
+        request=request,
+        extensions=response.extensions
+    )
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    """Response body that frees the concurrency slot once it is closed."""
+
+    def __init__(self, stream, release):
+        self.stream = stream
+        self.release = release
+
+    def __iter__(self):
+        yield from self.stream
+        self._release()
+
+    def _release(self):
+        if self.release:
+            self.release()
+            self.release = None
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            self._release()
+
+
+class _AsyncReleasingStream(httpx.AsyncByteStream):
+    """Response body that frees the concurrency slot once it is closed."""
+
+    def __init__(self, stream, release):
+        self.stream = stream
+        self.release = release
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            yield chunk
+        self._release()
+
+    def _release(self):
+        if self.release:
+            self.release()
+            self.release = None
+
+    async def aclose(self):
+        try:
+            await self.stream.aclose()
+        finally:
+            self._release()
+
+
+class GatewayTransport(httpx.BaseTransport):
+    """httpx transport sending requests through a ModelGateway (used by sync clients)."""
+
+    def __init__(self, gateway: ModelGateway, transport: httpx.BaseTransport):
+        self.gateway = gateway
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        body = request.read()
+        key = self.gateway.coalesce_key(request, body)
+        if key is None:
+            return self._send(request, stream=True)
+
+        gateway = self.gateway
+        while True:
+            with gateway.inflight_lock:
+                leader = gateway.sync_inflight.get(key)
+                if leader is None:
+                    leader = {"done": threading.Event()}
+                    gateway.sync_inflight[key] = leader
+                    break
+
+            record_gateway(gateway.model, "coalesced")
+            leader["done"].wait()
+            if "error" in leader:
+                raise leader["error"]
+            if "response" in leader:
+                return _buffered(leader["response"], leader["raw"], request)
+            # The leader was interrupted before it got an answer: retry, maybe as the new leader
+
+        try:
+            leader["response"], leader["raw"] = self._send(request, stream=False)
+            return _buffered(leader["response"], leader["raw"], request)
+        except Exception as e:
+            leader["error"] = e
+            raise
+        finally:
+            with gateway.inflight_lock:
+                gateway.sync_inflight.pop(key, None)
+            leader["done"].set()
+
+    def _send(self, request: httpx.Request, stream: bool) -> httpx.Response:
+        gateway = self.gateway
+        attempt = 0
+        while True:
+            delay = gateway.throttle_delay()
+            if delay:
+                time.sleep(delay)
+
+            gateway.slots.acquire()
+            try:
+                response = self.transport.handle_request(request)
+            except httpx.TransportError:
+                gateway.slots.release()
+                if attempt >= gateway.max_retries:
+                    raise
+                time.sleep(gateway.retry_delay(attempt))
+                attempt += 1
+                continue
+            except BaseException:
+                gateway.slots.release()
+                raise
+
+            if gateway.should_retry(attempt, response):
+                response.close()
+                gateway.slots.release()
+                time.sleep(gateway.retry_delay(attempt, response))
+                attempt += 1
+                continue
+
+            if stream:
+                if response.is_closed:
+                    gateway.slots.release()
+                else:
+                    response.stream = _ReleasingStream(response.stream, gateway.slots.release)
+                return response
+            try:
+                raw = b"".join(response.stream)
+            finally:
+                response.close()
+                gateway.slots.release()
+            return response, raw
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncGatewayTransport(httpx.AsyncBaseTransport):
+    """httpx transport sending requests through a ModelGateway (used by async clients)."""
+
+    def __init__(self, gateway: ModelGateway, transport: httpx.AsyncBaseTransport):
+        self.gateway = gateway
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        key = self.gateway.coalesce_key(request, body)
+        if key is None:
+            return await self._send(request, stream=True)
+
+        inflight = self.gateway.async_inflight
+        while key in inflight:
+            record_gateway(self.gateway.model, "coalesced")
+            result = await asyncio.shield(inflight[key])
+            if result is not None:
+                return _buffered(*result, request)
+            # The leader was cancelled before it got an answer: retry, maybe as the new leader
+
+        leader = asyncio.get_running_loop().create_future()
+        # Avoid "exception never retrieved" warnings when nobody else waited
+        leader.add_done_callback(lambda future: future.cancelled() or future.exception())
+        inflight[key] = leader
+        try:
+            response, raw = await self._send(request, stream=False)
+            leader.set_result((response, raw))
+            return _buffered(response, raw, request)
+        except Exception as e:
+            leader.set_exception(e)
+            raise
+        finally:
+            # A cancelled leader must not cancel its followers
+            if not leader.done():
+                leader.set_result(None)
+            inflight.pop(key, None)
+
+    async def _send(self, request: httpx.Request, stream: bool) -> httpx.Response:
+        gateway = self.gateway
+        slots = gateway.slots
+        attempt = 0
+        while True:
+            delay = gateway.throttle_delay()
+            if delay:
+                await asyncio.sleep(delay)
+
+            await slots.acquire_async()
+            try:
+                response = await self.transport.handle_async_request(request)
+            except httpx.TransportError:
+                slots.release()
+                if attempt >= gateway.max_retries:
+                    raise
+                await asyncio.sleep(gateway.retry_delay(attempt))
+                attempt += 1
+                continue
+            except BaseException:
+                slots.release()
+                raise
+
+            if gateway.should_retry(attempt, response):
+                await response.aclose()
+                slots.release()
+                await asyncio.sleep(gateway.retry_delay(attempt, response))
+                attempt += 1
+                continue
+
+            if stream:
+                if response.is_closed:
+                    slots.release()
+                else:
+                    response.stream = _AsyncReleasingStream(response.stream, slots.release)
+                return response
+            try:
+                raw = b"".join([chunk async for chunk in response.stream])
+            finally:
+                await response.aclose()
+                slots.release()
+            return response, raw
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+_gateways = {}
+_gateways_lock = threading.Lock()
+
+
+def get_gateway(model: str) -> ModelGateway:
+    """Returns the gateway shared by every client of a model."""
+    with _gateways_lock:
+        gateway = _gateways.get(model)
+        if gateway is None:
+            gateway = ModelGateway(model)
+            _gateways[model] = gateway
+        return gateway
+
@@ -0,0 +1,139 @@
+# services/mapped_index.py
+#
+# On-disk index format shared by every worker. A version directory holds
+#   vectors.npy   float32 embeddings, one row per chunk
+#   offsets.npy   uint64 byte offsets of each chunk record in chunks.bin
+#   chunks.bin    JSON records {"id", "text", "metadata"} back to back
+# All three are memory-mapped read-only, so the pages are shared through the
+# OS page cache instead of being copied into each worker.
+
+import os
+import json
+import mmap
+import numpy as np
+from langchain_core.documents import Document
+from langchain_community.docstore.base import Docstore
+
+VECTORS_FILE = "vectors.npy"
+OFFSETS_FILE = "offsets.npy"
+CHUNKS_FILE = "chunks.bin"
+
+
+class MappedFlatIndex:
+    """Read-only exact L2 search over memory-mapped vectors.
+
+    Implements the parts of the faiss index interface the FAISS vectorstore
+    uses for searching (search, reconstruct, ntotal, d) and returns the same
+    squared L2 distances as faiss.IndexFlatL2.
+    """
+
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = vectors
+        self.ntotal, self.d = vectors.shape
+        self._norms = np.einsum("ij,ij->i", vectors, vectors)
+
+    def search(self, queries, k: int):
+        queries = np.asarray(queries, dtype=np.float32)
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        found = min(k, self.ntotal)
+        if found == 0:
+            return distances, indices
+
+        scores = (
+            np.einsum("ij,ij->i", queries, queries)[:, None]
+            - 2 * queries @ self.vectors.T
+            + self._norms[None, :]
+        )
+        nearest = np.argpartition(scores, found - 1, axis=1)[:, :found]
+        nearest_scores = np.take_along_axis(scores, nearest, axis=1)
+        order = np.argsort(nearest_scores, axis=1)
+        indices[:, :found] = np.take_along_axis(nearest, order, axis=1)
+        distances[:, :found] = np.maximum(np.take_along_axis(nearest_scores, order, axis=1), 0)
+        return distances, indices
+
+    def reconstruct(self, i: int) -> np.ndarray:
+        return np.array(self.vectors[i])
+
+    def reconstruct_n(self, start: int, count: int) -> np.ndarray:
+        return np.array(self.vectors[start:start + count])
+
+
+class MappedChunkStore(Docstore):
+    """Read-only docstore over chunks.bin; documents are keyed by their row number."""
+
+    def __init__(self, version_dir: str):
+        self.offsets = np.load(os.path.join(version_dir, OFFSETS_FILE), mmap_mode="r")
+        with open(os.path.join(version_dir, CHUNKS_FILE), "rb") as file:
+            self._data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def record(self, position: int) -> dict:
+        start, end = int(self.offsets[position]), int(self.offsets[position + 1])
+        return json.loads(self._data[start:end])
+
+    def search(self, search):
+        try:
+            record = self.record(int(search))
+        except (ValueError, IndexError):
+            return f"ID {search} not found."
+        return Document(page_content=record["text"], metadata=record["metadata"])
+
+    def add(self, texts):
+        raise NotImplementedError("Mapped indexes are read-only")
+
+    def delete(self, ids):
+        raise NotImplementedError("Mapped indexes are read-only")
+
+
+class _RowIds:
+    """index_to_docstore_id for mapped indexes: each row is its own docstore key."""
+
+    def __init__(self, count: int):
+        self.count = count
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.count:
+            raise KeyError(i)
+        return int(i)
+
+    def __len__(self):
+        return self.count
+
+
+def write_version(version_dir: str, vectors: np.ndarray, records: list):
+    """Writes the vectors and chunk records ({"id", "text", "metadata"}) of a new version."""
+    os.makedirs(version_dir, exist_ok=True)
+    np.save(os.path.join(version_dir, VECTORS_FILE), np.ascontiguousarray(vectors, dtype=np.float32))
+
+    offsets = [0]
+    with open(os.path.join(version_dir, CHUNKS_FILE), "wb") as file:
+        for record in records:
+            data = json.dumps(record).encode("utf-8")
+            file.write(data)
+            offsets.append(offsets[-1] + len(data))
+        file.flush()
+        os.fsync(file.fileno())
+    np.save(os.path.join(version_dir, OFFSETS_FILE), np.array(offsets, dtype=np.uint64))
+
+
+def read_version(version_dir: str):
+    """Returns (vectors, records) of a version as in-memory copies, for building the next version."""
+    vectors = np.load(os.path.join(version_dir, VECTORS_FILE))
+    chunks = MappedChunkStore(version_dir)
+    records = [chunks.record(i) for i in range(len(chunks))]
+    return vectors, records
+
+
+def open_vectorstore(version_dir: str, embeddings):
+    """Maps a version read-only as a FAISS vectorstore."""
+    from langchain_community.vectorstores import FAISS
+    vectors = np.load(os.path.join(version_dir, VECTORS_FILE), mmap_mode="r")
+    return FAISS(
+        embedding_function=embeddings,
+        index=MappedFlatIndex(vectors),
+        docstore=MappedChunkStore(version_dir),
+        index_to_docstore_id=_RowIds(len(vectors))
+    )
@@ -0,0 +1,203 @@
+# services/metrics.py
+#
+# Minimal in-process metrics rendered in the Prometheus text format. Values are
+# per worker process; Prometheus sums them across workers when scraping each one.
+
+import os
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from sub-millisecond cache hits to slow LLM calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Token count buckets for prompt context sizes
+TOKEN_BUCKETS = (64, 128, 256, 512, 768, 1024, 1536, 2048, 3072, 4096, 8192)
+
+# Add a Server-Timing header with the stage durations of each request ("1" enables)
+METRICS_TIMING_HEADER = os.getenv("METRICS_TIMING_HEADER", "0") == "1"
+
+_metrics = []
+_lock = threading.Lock()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    """Monotonic count per label set."""
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        _metrics.append(self)
+
+    def inc(self, *labels, amount: float = 1):
+        with _lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with _lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    """Observations counted into cumulative buckets per label set."""
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._values = {}
+        _metrics.append(self)
+
+    def observe(self, value: float, *labels):
+        with _lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+            counts = entry[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            for labels, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    le = 'le="' + _number(bound) + '"'
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+                le = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {count}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {repr(total)}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    "chatbot_request_seconds", "Time to produce the response of an HTTP request", ("route", "status")
+)
+STAGE_SECONDS = Histogram(
+    "chatbot_stage_seconds", "Duration of each processing stage", ("app", "stage")
+)
+CACHE_LOOKUPS = Counter(
+    "chatbot_cache_lookups_total", "Cache lookups by cache and result (hit or miss)", ("cache", "app", "result")
+)
+LLM_TOKENS = Counter(
+    "chatbot_llm_tokens_total", "Tokens sent to and generated by the LLMs", ("app", "model", "kind")
+)
+CONTEXT_TOKENS = Histogram(
+    "chatbot_context_tokens", "Tokens of retrieved context put into each QA prompt", ("app",), TOKEN_BUCKETS
+)
+LLM_GATEWAY_EVENTS = Counter(
+    "chatbot_llm_gateway_total", "Outbound model requests, retries and coalesced duplicates", ("model", "event")
+)
+LLM_THROTTLED_SECONDS = Counter(
+    "chatbot_llm_throttled_seconds_total", "Time outbound model requests waited for the rate limit", ("model",)
+)
+RETRIEVALS = Counter(
+    "chatbot_retrievals_total", "QA retrievals by route (lexical, hybrid or vector)", ("app", "route")
+)
+RECORD_WRITE_SECONDS = Histogram(
+    "chatbot_record_write_seconds", "Time to write one batch of customer records", ("store", "target")
+)
+RECORD_ROWS = Counter(
+    "chatbot_record_rows_total", "Customer records written", ("store", "target")
+)
+RECORD_ROWS_REJECTED = Counter(
+    "chatbot_record_rows_rejected_total", "Records refused because the writer queue was full", ("store",)
+)
+
+
+def render() -> str:
+    """Returns every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Stage durations of the request being handled, for the Server-Timing header
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def start_request_timing() -> list:
+    """Starts collecting the stage durations of the current request."""
+    timings = []
+    _request_timings.set(timings)
+    return timings
+
+
+def server_timing_header(timings: list) -> str:
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings)
+
+
+def record_stage(app: str, stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, app, stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def timed(app: str, stage: str):
+    """Records how long the block takes as a stage of an app."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(app, stage, time.perf_counter() - started)
+
+
+def record_cache_lookup(cache: str, app: str, hit: bool, count: int = 1):
+    if count:
+        CACHE_LOOKUPS.inc(cache, app, "hit" if hit else "miss", amount=count)
+
+
+def record_tokens(app: str, model: str, prompt_tokens: int = 0, completion_tokens: int = 0):
+    if prompt_tokens:
+        LLM_TOKENS.inc(app, model, "prompt", amount=prompt_tokens)
+    if completion_tokens:
+        LLM_TOKENS.inc(app, model, "completion", amount=completion_tokens)
+
+
+def record_context_tokens(app: str, tokens: int):
+    CONTEXT_TOKENS.observe(tokens, app)
+
+
+def record_gateway(model: str, event: str, throttled_seconds: float = 0.0):
+    LLM_GATEWAY_EVENTS.inc(model, event)
+    if throttled_seconds:
+        LLM_THROTTLED_SECONDS.inc(model, amount=throttled_seconds)
+
+
+def record_retrieval(app: str, route: str):
+    RETRIEVALS.inc(app, route)
@@ -0,0 +1,135 @@
+# services/model_clients.py
+
+import os
+import time
+import threading
+
+# Models used across the services
+QA_MODEL = os.getenv("QA_MODEL", "gpt-3.5-turbo-instruct")
+CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-3.5-turbo")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+
+# Keep-alive connection pool per model (retries are left to services/llm_gateway.py)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "60"))
+
+# Created clients by key, with the seconds each took to create
+_clients = {}
+_creation_times = {}
+_lock = threading.RLock()
+
+
+def _get_or_create(key: str, factory):
+    """Returns the client for a key, creating it on first use."""
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                started = time.perf_counter()
+                client = factory()
+                _creation_times[key] = time.perf_counter() - started
+                _clients[key] = client
+    return client
+
+
+def get_http_clients(model: str):
+    """Returns the pooled (sync, async) httpx clients for a model, routed through its gateway."""
+    def create():
+        import httpx
+        from services.llm_gateway import get_gateway, GatewayTransport, AsyncGatewayTransport
+        limits = httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE
+        )
+        # Every request for the model goes through its gateway (rate limit, concurrency, retries)
+        gateway = get_gateway(model)
+        return (
+            httpx.Client(
+                transport=GatewayTransport(gateway, httpx.HTTPTransport(limits=limits)),
+                timeout=HTTP_TIMEOUT
+            ),
+            httpx.AsyncClient(
+                transport=AsyncGatewayTransport(gateway, httpx.AsyncHTTPTransport(limits=limits)),
+                timeout=HTTP_TIMEOUT
+            )
+        )
+    return _get_or_create(f"http:{model}", create)
+
+
+def get_llm(streaming: bool = False):
+    """Returns the completion model used by the RetrievalQA chains.
+
+    The streaming variant reports each token to the callbacks as it arrives.
+    """
+    def create():
+        from langchain_openai import OpenAI
+        http_client, http_async_client = get_http_clients(QA_MODEL)
+        return OpenAI(
+            model_name=QA_MODEL,
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=http_client,
+            http_async_client=http_async_client,
+            max_retries=0,
+            streaming=streaming
+        )
+    return _get_or_create("llm_stream" if streaming else "llm", create)
+
+
+def get_chat_llm():
+    """Returns the chat model used to improve responses."""
+    def create():
+        from langchain_openai import ChatOpenAI
+        http_client, http_async_client = get_http_clients(CHAT_MODEL)
+        return ChatOpenAI(
+            model_name=CHAT_MODEL,
+            temperature=0.7,
+            max_tokens=300,
+            stream_usage=True,
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=http_client,
+            http_async_client=http_async_client,
+            max_retries=0
+        )
+    return _get_or_create("chat_llm", create)
+
+
+def get_embeddings():
+    """Returns the cached embedding model shared by every index and cache."""
+    def create():
+        from langchain_openai import OpenAIEmbeddings
+        from services.embedding_cache import CachedEmbeddings
+        http_client, http_async_client = get_http_clients(EMBEDDING_MODEL)
+        return CachedEmbeddings(OpenAIEmbeddings(
+            model=EMBEDDING_MODEL,
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=http_client,
+            http_async_client=http_async_client,
+            max_retries=0
+        ))
+    return _get_or_create("embeddings", create)
+
+
+def set_client(key: str, client):
+    """Replaces a shared client ("llm", "llm_stream", "chat_llm" or "embeddings"), e.g. with a fake for benchmarks."""
+    with _lock:
+        _clients[key] = client
+        _creation_times[key] = 0.0
+
+
+def client_report() -> dict:
+    """Returns the clients created so far and the seconds each took to create."""
+    with _lock:
+        return dict(_creation_times)
+
+
+async def close_clients():
+    """Closes the pooled HTTP connections of every model."""
+    with _lock:
+        pools = [client for key, client in _clients.items() if key.startswith("http:")]
+        for key in [key for key in _clients if key.startswith("http:")]:
+            del _clients[key]
+    for http_client, http_async_client in pools:
+        http_client.close()
+        await http_async_client.aclose()
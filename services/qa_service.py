@@ -0,0 +1,113 @@
+# services/qa_service.py
+
+from langchain.chains import RetrievalQA
+import time
+from langchain_core.callbacks import AsyncCallbackHandler
+from services.index_store import get_retriever
+from services.model_clients import get_llm, get_embeddings
+from services.answer_cache import get_answer_cache
+from services.executor import run_blocking
+from services.metrics import timed, record_stage, record_cache_lookup, record_tokens
+from scripts.improve_responses import IMPROVEMENT_MODE, get_fused_prompt, normalize_query
+
+class TokenCallback(AsyncCallbackHandler):
+    """Passes each token the LLM generates to `on_token`."""
+
+    def __init__(self, on_token):
+        self.on_token = on_token
+
+    async def on_llm_new_token(self, token: str, **kwargs):
+        if token:
+            self.on_token(token)
+
+
+class StageMetricsCallback(AsyncCallbackHandler):
+    """Records retrieval and LLM durations and LLM token counts of a QA chain run."""
+
+    def __init__(self, app: str):
+        self.app = app
+        self._started = {}
+
+    async def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    async def on_retriever_end(self, documents, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            record_stage(self.app, "retrieval", time.perf_counter() - started)
+
+    async def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    async def on_llm_end(self, response, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            record_stage(self.app, "qa_llm", time.perf_counter() - started)
+        llm_output = response.llm_output or {}
+        usage = llm_output.get("token_usage") or {}
+        record_tokens(
+            self.app,
+            llm_output.get("model_name", "unknown"),
+            usage.get("prompt_tokens", 0),
+            usage.get("completion_tokens", 0)
+        )
+
+
+def get_qa_chain(app: str, streaming: bool = False):
+    """Create a QA chain over the persistent index for an app, or None if it has no documents"""
+    retriever = get_retriever(app)
+    if retriever is None:
+        return None
+
+    chain_type_kwargs = {}
+    if IMPROVEMENT_MODE == "fused":
+        # Answer and style improvement happen in a single LLM call
+        chain_type_kwargs["prompt"] = get_fused_prompt(app)
+
+    return RetrievalQA.from_chain_type(
+        llm=get_llm(streaming),
+        chain_type="stuff",
+        retriever=retriever,
+        return_source_documents=True,
+        chain_type_kwargs=chain_type_kwargs
+    )
+
+
+async def answer_query(app: str, query: str, on_token=None):
+    """Answer a query from the app documents, reusing a cached answer for near-identical queries.
+
+    Queries the lexical index matches with high confidence are neither embedded
+    nor looked up semantically; their answers are cached by normalized query text.
+    If `on_token` is given, it is called with the answer text as it is generated.
+    Returns None if the app has no documents.
+    """
+    # Loading the index (and the fused prompt's feedback) touches disk
+    with timed(app, "qa_setup"):
+        qa_chain = await run_blocking(get_qa_chain, app, on_token is not None)
+    if qa_chain is None:
+        return None
+
+    answer_cache = get_answer_cache(app)
+    key = normalize_query(query)
+    query_vector = None
+    with timed(app, "lexical_match"):
+        lexical = qa_chain.retriever.lexical_match(query) is not None
+    if not lexical:
+        with timed(app, "embed_query"):
+            query_vector = await get_embeddings().aembed_query(query)
+    cached_answer = answer_cache.lookup(query_vector, key)
+    record_cache_lookup("answer", app, cached_answer is not None)
+    if cached_answer is not None:
+        if on_token is not None:
+            on_token(cached_answer)
+        return cached_answer
+
+    callbacks = [StageMetricsCallback(app)]
+    if on_token is not None:
+        callbacks.append(TokenCallback(on_token))
+    result = await qa_chain.ainvoke({"query": query}, config={"callbacks": callbacks})
+    answer = result.get("result")
+    if answer:
+        source_ids = [doc.metadata.get("id") for doc in result.get("source_documents", [])]
+        answer_cache.store(query_vector, answer, source_ids, key)
+    return answer
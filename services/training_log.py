@@ -0,0 +1,227 @@
+# services/training_log.py
+#
+# Append-only JSON-lines logs under training_data/, written in batches by a
+# background thread (see functions/record_writer.py). The active file keeps
+# its name (e.g. training_data/sabi_training.jsonl); once it reaches
+# TRAINING_LOG_MAX_BYTES, or on the first write of a new day, it is renamed
+# to a timestamped segment that is then gzip-compressed:
+#   training_data/sabi_training.20240101-120000-000000.jsonl.gz
+# read_log() returns the entries of every segment, oldest first, then those
+# of the active file; compact_log() merges the segments keeping one entry per key.
+
+import os
+import re
+import gzip
+import json
+import atexit
+import shutil
+import threading
+from datetime import datetime, date
+from contextlib import contextmanager
+from functions.record_writer import RecordSink
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process file locks
+    fcntl = None
+
+# Size at which the active file is rotated, and whether it is also rotated daily ("1")
+TRAINING_LOG_MAX_BYTES = int(os.getenv("TRAINING_LOG_MAX_BYTES", str(64 * 1024 * 1024)))
+TRAINING_LOG_ROTATE_DAILY = os.getenv("TRAINING_LOG_ROTATE_DAILY", "1") == "1"
+
+SEGMENT_PATTERN = re.compile(r"\.(\d{8}-\d{6}-\d{6})\.jsonl(\.gz)?$")
+
+
+def _base(path: str) -> str:
+    return path[:-len(".jsonl")] if path.endswith(".jsonl") else path
+
+
+def list_segments(path: str) -> list:
+    """Returns the closed segments of a log, oldest first."""
+    directory, prefix = os.path.split(_base(path))
+    try:
+        names = os.listdir(directory or ".")
+    except FileNotFoundError:
+        return []
+    segments = [
+        name for name in names
+        if name.startswith(prefix) and SEGMENT_PATTERN.fullmatch(name[len(prefix):])
+    ]
+    return [os.path.join(directory, name) for name in sorted(segments)]
+
+
+@contextmanager
+def _log_lock(path: str):
+    """Serialises rotation and writes of a log across threads and worker processes."""
+    with open(path + ".lock", 'a') as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _should_rotate(path: str) -> bool:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return False
+    if stat.st_size == 0:
+        return False
+    if stat.st_size >= TRAINING_LOG_MAX_BYTES:
+        return True
+    return TRAINING_LOG_ROTATE_DAILY and date.fromtimestamp(stat.st_mtime) != date.today()
+
+
+def _rotate(path: str) -> str:
+    """Renames the active file to a new segment (with the lock held) and returns the segment."""
+    segment = f"{_base(path)}.{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.jsonl"
+    os.replace(path, segment)
+    return segment
+
+
+def compress_segment(segment: str) -> str:
+    """Gzips a closed segment in place of the original and returns the new path."""
+    compressed = segment + ".gz"
+    temporary = compressed + ".tmp"
+    with open(segment, 'rb') as source, gzip.open(temporary, 'wb') as target:
+        shutil.copyfileobj(source, target)
+    os.replace(temporary, compressed)
+    os.remove(segment)
+    return compressed
+
+
+def _open_text(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    try:
+        return open(path, 'r', encoding='utf-8')
+    except FileNotFoundError:
+        # Compressed since it was listed
+        if SEGMENT_PATTERN.search(path):
+            return gzip.open(path + ".gz", 'rt', encoding='utf-8')
+        raise
+
+
+def read_log(path: str):
+    """Yields the entries of a log, oldest first, skipping unreadable lines."""
+    files = list_segments(path)
+    if os.path.exists(path):
+        files.append(path)
+    for file_path in files:
+        try:
+            with _open_text(file_path) as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except (OSError, EOFError) as e:
+            print(f"Error reading {file_path}: {str(e)}")
+
+
+def compact_log(path: str, key) -> tuple:
+    """Rewrites the log as a single segment holding the latest entry for each key(entry).
+
+    The active file is rotated first so every entry logged so far is merged.
+    The lock is held throughout: writers wait (in the background writer
+    thread) and no segment is compressed while it is being merged.
+    Returns (entries read, entries kept).
+    """
+    if not os.path.isdir(os.path.dirname(path) or "."):
+        return 0, 0  # nothing logged yet
+    with _log_lock(path):
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            _rotate(path)
+        segments = list_segments(path)
+        if not segments:
+            return 0, 0
+
+        read = 0
+        latest = {}
+        for file_path in segments:
+            with _open_text(file_path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    read += 1
+                    entry_key = key(entry)
+                    # Re-inserting keeps the entries in the order of their latest version
+                    latest.pop(entry_key, None)
+                    latest[entry_key] = entry
+
+        # The compacted segment takes the name of the newest one, so it still sorts before later segments
+        target = segments[-1] if segments[-1].endswith(".gz") else segments[-1] + ".gz"
+        temporary = target + ".tmp"
+        with gzip.open(temporary, 'wt', encoding='utf-8') as f:
+            for entry in latest.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(temporary, target)
+        for file_path in segments:
+            if file_path != target:
+                try:
+                    os.remove(file_path)
+                except FileNotFoundError:
+                    pass
+        return read, len(latest)
+
+
+class TrainingLogSink(RecordSink):
+    """Record sink appending JSON lines to training logs, rotating them as they grow.
+
+    Each batch is written under the log's lock file; segments closed by a
+    rotation are then compressed by the writer thread, under the lock again
+    so a compaction never merges a segment that is being compressed.
+    """
+
+    store = "training"
+
+    def _write_rows(self, path: str, header, rows: list):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        rotated = None
+        with _log_lock(path):
+            if _should_rotate(path):
+                rotated = _rotate(path)
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write("".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows))
+        if rotated:
+            try:
+                with _log_lock(path):
+                    # A compaction may have merged it in the meantime
+                    if os.path.exists(rotated):
+                        compress_segment(rotated)
+            except Exception as e:
+                # Left uncompressed; still read by read_log and merged by compact_log
+                print(f"Error compressing {rotated}: {str(e)}")
+
+
+_training_log = None
+_training_log_lock = threading.Lock()
+
+
+def append_entry(path: str, entry: dict):
+    """Queues an entry for a training log; it is written in the background."""
+    global _training_log
+    if _training_log is None:
+        with _training_log_lock:
+            if _training_log is None:
+                _training_log = TrainingLogSink()
+    _training_log.append(path, None, entry)
+
+
+def close_training_log():
+    """Writes pending entries and stops the writer."""
+    global _training_log
+    with _training_log_lock:
+        if _training_log is not None:
+            _training_log.close()
+            _training_log = None
+
+
+atexit.register(close_training_log)
@@ -0,0 +1,14 @@
+# tests/conftest.py
+#
+# Offline tests for the deterministic parts of the services; model calls use
+# the fakes in scripts/benchmark_fakes.py, so no API key or network is needed.
+# Run from the project root: python -m pytest -q
+
+import os
+import sys
+
+# Token counts must not depend on downloading the tiktoken encoding
+os.environ.setdefault("CHUNK_TOKENIZER", "estimate")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
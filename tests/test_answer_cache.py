@@ -0,0 +1,59 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from services.answer_cache import AnswerCache
+
+
+def _vector(*values):
+    return np.array(values, dtype=np.float32)
+
+
+def test_similar_queries_share_an_answer():
+    cache = AnswerCache(threshold=0.95)
+    cache.store(_vector(1, 0, 0), "two days", ["a"])
+    assert cache.lookup(_vector(0.99, 0.05, 0)) == "two days"
+    assert cache.lookup(_vector(0, 1, 0)) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_exact_key_lookup_needs_no_vector():
+    cache = AnswerCache()
+    cache.store(None, "cash or transfer", ["b"], key="can i pay on delivery")
+    assert cache.lookup(key="can i pay on delivery") == "cash or transfer"
+    assert cache.lookup(key="other question") is None
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["exact_entries"] == 1
+
+
+def test_key_is_tried_before_the_vector():
+    cache = AnswerCache()
+    cache.store(_vector(1, 0), "by key", ["a"], key="q")
+    assert cache.lookup(_vector(0, 1), key="q") == "by key"
+    assert cache.lookup(_vector(1, 0), key="other") == "by key"
+
+
+def test_invalidating_a_source_drops_both_lookups():
+    cache = AnswerCache()
+    cache.store(_vector(1, 0), "stale", ["a", "b"], key="q1")
+    cache.store(_vector(0, 1), "fresh", ["c"], key="q2")
+    assert cache.invalidate_sources(["b"]) == 1
+    assert cache.lookup(_vector(1, 0)) is None
+    assert cache.lookup(key="q1") is None
+    assert cache.lookup(key="q2") == "fresh"
+
+
+def test_oldest_entries_are_evicted():
+    cache = AnswerCache(max_entries=2)
+    for i, vector in enumerate((_vector(1, 0, 0), _vector(0, 1, 0), _vector(0, 0, 1))):
+        cache.store(vector, f"answer {i}", [str(i)], key=f"q{i}")
+    assert cache.lookup(_vector(1, 0, 0)) is None
+    assert cache.lookup(key="q0") is None
+    assert cache.lookup(_vector(0, 0, 1)) == "answer 2"
+
+
+def test_clear_empties_the_cache():
+    cache = AnswerCache()
+    cache.store(_vector(1, 0), "answer", ["a"], key="q")
+    cache.clear()
+    assert cache.lookup(_vector(1, 0), key="q") is None
@@ -0,0 +1,52 @@
+from services.chunking import chunk_document, count_tokens
+
+FAQ = (
+    "Q: How long does delivery take?\n"
+    "A: Orders in Lagos arrive within 2 days. Other states take up to 5 days.\n"
+    "\n"
+    "Q: Can I pay on delivery?\n"
+    "A: Yes, cash and transfer are accepted on delivery.\n"
+    "\n"
+    "Q: How do I return an item?\n"
+    "A: Send us your order number and the reason within 7 days.\n"
+)
+
+
+def test_offsets_match_the_text():
+    text = FAQ * 5
+    for chunk in chunk_document(text, max_tokens=40):
+        assert text[chunk.start:chunk.end] == chunk.text
+        assert chunk.tokens == count_tokens(chunk.text)
+
+
+def test_chunks_stay_within_the_budget():
+    for chunk in chunk_document(FAQ * 5, max_tokens=40):
+        assert chunk.tokens <= 40
+
+
+def test_pairs_that_fit_are_never_split():
+    chunks = chunk_document(FAQ, max_tokens=40)
+    for question in ("Q: How long", "Q: Can I pay", "Q: How do I return"):
+        holder = next(chunk for chunk in chunks if question in chunk.text)
+        assert holder.text.index(question) < holder.text.index("A:", holder.text.index(question))
+
+
+def test_small_document_is_one_chunk():
+    chunks = chunk_document(FAQ, max_tokens=1000)
+    assert len(chunks) == 1
+    assert chunks[0].text == FAQ.strip()
+
+
+def test_long_pair_is_cut_with_overlap():
+    answer = " ".join(f"Step {i} takes about {i} hours to finish." for i in range(60))
+    text = f"Q: What are the steps?\nA: {answer}\n"
+    chunks = chunk_document(text, max_tokens=50, overlap_tokens=12)
+    assert len(chunks) > 1
+    assert all(chunk.tokens <= 50 for chunk in chunks)
+    for first, second in zip(chunks, chunks[1:]):
+        assert second.start < first.end
+        assert second.end > first.end
+
+
+def test_blank_document_has_no_chunks():
+    assert chunk_document("  \n\n  ") == []
@@ -0,0 +1,97 @@
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("langchain_core")
+
+from langchain_core.documents import Document
+from services.context_assembler import (
+    ContextRetriever, assemble_context, build_lexical_index, fuse_rankings
+)
+from services.chunking import count_tokens
+from scripts.benchmark_fakes import FakeEmbeddings
+
+TEXTS = [
+    "Q: How long does delivery to Lagos take?\nA: Two days.",
+    "Q: How long does delivery to Abuja take?\nA: Five days.",
+    "Q: Can I pay on delivery?\nA: Yes, cash and transfer are accepted.",
+    "Q: How do I return Milo tins?\nA: Send your order number within seven days.",
+]
+
+
+def _document(text, start, end, source="faq.txt"):
+    return Document(page_content=text, metadata={"source": source, "start": start, "end": end})
+
+
+def test_rrf_prefers_rows_ranked_well_in_both_lists():
+    assert fuse_rankings([1, 2, 3], [2, 4, 5]) == [2, 1, 4, 3, 5]
+
+
+def test_overlapping_chunks_are_merged():
+    text = "abcdefghij"
+    chosen = assemble_context([_document(text[0:6], 0, 6), _document(text[4:10], 4, 10)], budget=100)
+    assert len(chosen) == 1
+    assert chosen[0].page_content == text
+    assert (chosen[0].metadata["start"], chosen[0].metadata["end"]) == (0, 10)
+
+
+def test_budget_and_chunk_limit_are_respected():
+    candidates = [_document(f"chunk {i} " * 10, i * 100, i * 100 + 50, f"{i}.txt") for i in range(6)]
+    per_chunk = count_tokens(candidates[0].page_content)
+    assert len(assemble_context(candidates, budget=per_chunk * 3)) == 3
+    assert len(assemble_context(candidates, budget=1000, max_chunks=4)) == 4
+
+
+def test_a_chunk_over_the_budget_leaves_room_for_shorter_ones():
+    candidates = [_document("long " * 100, 0, 500, "a.txt"), _document("short", 0, 5, "b.txt")]
+    assert [document.page_content for document in assemble_context(candidates, budget=10)] == ["short"]
+
+
+@pytest.fixture
+def retriever():
+    pytest.importorskip("faiss")
+    from langchain_community.vectorstores import FAISS
+    embeddings = FakeEmbeddings(size=32, latency=0)
+    vectorstore = FAISS.from_texts(TEXTS, embeddings)
+    retriever = ContextRetriever(
+        vectorstore=vectorstore, app="test", budget=1000, max_chunks=2,
+        lexical=build_lexical_index(vectorstore)
+    )
+    return retriever, embeddings
+
+
+def test_confident_lexical_match_skips_the_embedding(retriever):
+    retriever, embeddings = retriever
+    calls = embeddings.calls
+    documents = retriever.invoke("How do I return Milo tins?")
+    assert embeddings.calls == calls
+    assert documents[0].page_content == TEXTS[3]
+
+
+def test_other_queries_are_fused_with_the_vector_search(retriever):
+    retriever, embeddings = retriever
+    assert retriever.lexical_match("delivery") is None
+    calls = embeddings.calls
+    documents = retriever.invoke("delivery")
+    assert embeddings.calls == calls + 1
+    assert len(documents) == 2
+
+
+def test_without_a_lexical_index_every_query_is_embedded(retriever):
+    retriever, embeddings = retriever
+    retriever.lexical = None
+    calls = embeddings.calls
+    retriever.invoke("How do I return Milo tins?")
+    assert embeddings.calls == calls + 1
+
+
+def test_the_chain_reuses_the_lexical_match_of_its_query(retriever, monkeypatch):
+    retriever, _ = retriever
+    calls = []
+    match = retriever.lexical.match
+    monkeypatch.setattr(retriever.lexical, "match", lambda *args, **kwargs: calls.append(args) or match(*args, **kwargs))
+    rows = retriever.lexical_match("How do I return Milo tins?")
+    documents = retriever.invoke("How do I return Milo tins?")
+    assert len(calls) == 1
+    assert documents[0].page_content == TEXTS[rows[0]]
+    retriever.invoke("delivery")
+    assert len(calls) == 2
@@ -0,0 +1,52 @@
+import pytest
+from services.intent_router import (
+    classify_intent, resolve_followup, IntentResult, RETURN_REQUEST, RETURN_PROMPT, RETURN_REASON_PROMPT,
+    TRACK_ORDER, TRACK_PROMPT, ISSUE_REPORT, CALLBACK_REQUEST, CALLBACK_PROMPT, PHONE_CALLBACK,
+    NEW_ORDER, ORDER_PROMPT, QUESTION
+)
+
+
+@pytest.mark.parametrize("query, intent", [
+    ("GL78340824 Wrong size delivered", RETURN_REQUEST),
+    ("I want to return my shoes", RETURN_PROMPT),
+    ("Track order GL09395824", TRACK_ORDER),
+    ("Where is my package?", TRACK_PROMPT),
+    ("The product was damaged, there is a problem", ISSUE_REPORT),
+    ("Please call me back on 08012345678", CALLBACK_REQUEST),
+    ("Can you call me back?", CALLBACK_PROMPT),
+    ("08012345678", PHONE_CALLBACK),
+    ("Milo (3 cans), Rice (2 packs)", NEW_ORDER),
+    ("I would like to place an order", ORDER_PROMPT),
+    ("What payment methods do you accept?", QUESTION),
+])
+def test_classify_intent(query, intent):
+    assert classify_intent(query).intent == intent
+
+
+def test_entities_are_extracted():
+    assert classify_intent("GL78340824 Wrong size delivered").reason == "Wrong size delivered"
+    assert classify_intent("Track order GL09395824").order_number == "GL09395824"
+    assert classify_intent("call me back on 080-1234-5678").phone_number == "08012345678"
+    items = classify_intent("Milo (3 cans), Rice (2 packs)").items
+    assert [quantity for _, quantity in items] == ["3", "2"]
+    assert "Milo" in items[0][0] and "Rice" in items[1][0]
+
+
+def test_followups_complete_the_pending_prompt():
+    result = resolve_followup(classify_intent("GL09395824"), "GL09395824", TRACK_PROMPT)
+    assert result == IntentResult(TRACK_ORDER, order_number="GL09395824")
+
+    result = resolve_followup(classify_intent("GL09395824"), "GL09395824", RETURN_PROMPT)
+    assert result == IntentResult(RETURN_REASON_PROMPT, order_number="GL09395824")
+
+    result = resolve_followup(classify_intent("It was too small"), "It was too small",
+                              RETURN_REASON_PROMPT, "GL09395824")
+    assert result == IntentResult(RETURN_REQUEST, order_number="GL09395824", reason="It was too small")
+
+    result = resolve_followup(classify_intent("08012345678"), "08012345678", CALLBACK_PROMPT)
+    assert result == IntentResult(CALLBACK_REQUEST, phone_number="08012345678")
+
+
+def test_without_a_pending_prompt_the_intent_is_kept():
+    result = classify_intent("GL09395824")
+    assert resolve_followup(result, "GL09395824", None) is result
@@ -0,0 +1,63 @@
+import pytest
+from services.lexical_index import LexicalIndex, tokenize
+
+
+@pytest.fixture
+def index():
+    index = LexicalIndex()
+    index.add("Delivery in Lagos takes two days", "lagos")
+    index.add("Delivery to Abuja takes five days", "abuja")
+    index.add("Milo tins come in packs of three", "milo")
+    index.add("Refunds are paid within seven days of the return", "refund")
+    return index
+
+
+def test_tokenize_drops_stop_words_and_punctuation():
+    assert tokenize("Where is my order GL09395824?") == ["order", "gl09395824"]
+
+
+def test_documents_are_ranked_by_bm25(index):
+    results = index.search("delivery days lagos")
+    assert [payload for _, payload in results][0] == "lagos"
+    assert [score for score, _ in results] == sorted((score for score, _ in results), reverse=True)
+
+
+def test_common_terms_alone_match_every_document(index):
+    assert {payload for _, payload in index.search("delivery")} == {"lagos", "abuja"}
+
+
+def test_pruning_skips_documents_with_only_common_terms(index):
+    # "days" is in three documents, "lagos" in one: once "lagos" has found its
+    # document, pruning stops "days" from adding the others
+    assert [payload for _, payload in index.search("lagos days")] == ["lagos"]
+    exhaustive = [payload for _, payload in index.search("lagos days", prune=False)]
+    assert exhaustive[0] == "lagos"
+    assert set(exhaustive) == {"lagos", "abuja", "refund"}
+
+
+def test_unmatched_query_returns_nothing(index):
+    assert index.search("zzz unknown") == []
+    assert index.search("the and of") == []
+
+
+def test_coverage_is_the_matched_share_of_the_query(index):
+    (_, coverage, payload), *_ = index.match("milo packs")
+    assert payload == "milo"
+    assert coverage == pytest.approx(1.0)
+
+    (_, coverage, payload), *_ = index.match("milo sardines")
+    assert payload == "milo"
+    assert 0 < coverage < 1
+
+
+def test_adding_with_a_known_key_replaces_the_document():
+    index = LexicalIndex()
+    index.add("old answer about rice", "v1", key="rice")
+    index.add("new answer about beans", "v2", key="rice")
+    assert len(index) == 1
+    assert index.search("rice") == []
+    assert [payload for _, payload in index.search("beans")] == ["v2"]
+
+
+def test_k_limits_the_results(index):
+    assert len(index.search("days", k=2)) == 2
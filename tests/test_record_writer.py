@@ -0,0 +1,89 @@
+import csv
+import threading
+import pytest
+from functions.record_writer import RecordSink, CSVRecordSink, RecordQueueFull
+
+
+class ListSink(RecordSink):
+    """Collects the batches it is asked to write; the first `failures` writes fail."""
+
+    def __init__(self, failures: int = 0, **kwargs):
+        self.batches = []
+        self.failures = failures
+        super().__init__(**kwargs)
+
+    def _write_rows(self, target, header, rows):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("disk full")
+        self.batches.append((target, list(rows)))
+
+
+def test_flush_writes_every_row_in_order():
+    sink = ListSink(batch_size=1000, flush_interval=60)
+    for i in range(10):
+        sink.append("t", ["n"], [i])
+    assert sink.flush(timeout=5)
+    assert [row for _, rows in sink.batches for row in rows] == [[i] for i in range(10)]
+    sink.close()
+
+
+def test_rows_are_group_committed():
+    sink = ListSink(batch_size=5, flush_interval=60)
+    for i in range(10):
+        sink.append("t", ["n"], [i])
+    sink.flush(timeout=5)
+    assert len(sink.batches) <= 3
+    sink.close()
+
+
+def test_failed_batches_are_retried():
+    sink = ListSink(failures=1, batch_size=1000, flush_interval=0.01)
+    sink.append("t", ["n"], [1])
+    sink.flush(timeout=5)
+    sink.append("t", ["n"], [2])
+    sink.flush(timeout=5)
+    assert [row for _, rows in sink.batches for row in rows] == [[1], [2]]
+    sink.close()
+
+
+def test_flush_without_pending_rows_returns_at_once():
+    sink = ListSink(flush_interval=60)
+    assert sink.flush(timeout=0)
+    sink.append("t", ["n"], [1])
+    assert sink.flush(timeout=5)
+    assert sink.flush(timeout=0)
+    sink.close()
+
+
+def test_full_queue_refuses_rows_instead_of_growing():
+    gate = threading.Event()
+
+    class StalledSink(ListSink):
+        def _write_rows(self, target, header, rows):
+            gate.wait()
+            super()._write_rows(target, header, rows)
+
+    sink = StalledSink(batch_size=1, queue_size=2)
+    accepted = []
+    with pytest.raises(RecordQueueFull):
+        for i in range(10):
+            sink.append("t", ["n"], [i])
+            accepted.append([i])
+    gate.set()
+    sink.flush(timeout=5)
+    assert [row for _, rows in sink.batches for row in rows] == accepted
+    sink.close()
+
+
+def test_csv_sink_writes_the_header_once(tmp_path):
+    path = str(tmp_path / "orders.csv")
+    sink = CSVRecordSink(batch_size=2, flush_interval=60)
+    for i in range(5):
+        sink.append(path, ["id", "item"], [i, f"item {i}"])
+    sink.close()
+
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ["id", "item"]
+    assert rows[1:] == [[str(i), f"item {i}"] for i in range(5)]